@@ -1,8 +1,12 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from googleapiclient.errors import HttpError
 from email_assistant.src.logger import logger
+from email_assistant.src.serialization import JSON_HEADERS, json_dumps, json_loads
 
 
 class BaseEmailActions(ABC):
@@ -13,6 +17,13 @@ class BaseEmailActions(ABC):
         """Marks an email as spam."""
         pass
 
+    def mark_many_as_spam(self, email_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Marks several emails as spam, returning one result per email ID.
+        Providers with a bulk API should override this to avoid one request per email.
+        """
+        return [self.mark_as_spam(email_id=email_id) for email_id in email_ids]
+
     # Future actions like archive, move_to_folder, etc., would be defined here
     # @abstractmethod
     # def archive_email(self, email_id: str) -> Dict[str, Any]:
@@ -22,6 +33,14 @@ class BaseEmailActions(ABC):
 class GmailActions(BaseEmailActions):
     """Concrete implementation of email actions for the Gmail API."""
 
+    SPAM_LABEL_CHANGES = {
+        'addLabelIds': ['SPAM'],
+        'removeLabelIds': ['INBOX', 'UNREAD']
+    }
+    # Gmail limits: batchModify accepts up to 1000 IDs, a batch HTTP request up to 100 calls
+    BATCH_MODIFY_MAX_IDS = 1000
+    BATCH_HTTP_MAX_REQUESTS = 100
+
     def __init__(self, service: Any):
         if not service:
             raise ValueError("Gmail service client is required.")
@@ -31,46 +50,182 @@ class GmailActions(BaseEmailActions):
         """
         Marks a Gmail email as spam by adding the 'SPAM' label and removing 'INBOX' and 'UNREAD'.
         """
-        logger.info(f"---GMAIL ACTION: Marking email {email_id} as spam---")
+        logger.info("---GMAIL ACTION: Marking email %s as spam---", email_id)
         try:
-            body = {
-                'addLabelIds': ['SPAM'],
-                'removeLabelIds': ['INBOX', 'UNREAD']
-            }
-            result = self.service.users().messages().modify(userId='me', id=email_id, body=body).execute()
-            logger.info(f"Successfully marked email {email_id} as spam. Result: {result}")
+            result = self.service.users().messages().modify(userId='me', id=email_id, body=self.SPAM_LABEL_CHANGES).execute()
+            logger.info("Successfully marked email %s as spam. Result: %s", email_id, result)
             return {"status": "success", "email_id": email_id, "result": result}
         except HttpError as error:
-            logger.error(f"An error occurred while marking email {email_id} as spam: {error}")
+            logger.error("An error occurred while marking email %s as spam: %s", email_id, error)
             return {"status": "error", "email_id": email_id, "error": str(error)}
         except Exception as e:
-            logger.error(f"An unexpected error occurred: {e}")
+            logger.error("An unexpected error occurred: %s", e)
             return {"status": "error", "email_id": email_id, "error": str(e)}
 
+    def mark_many_as_spam(self, email_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Marks several Gmail emails as spam with a single batchModify call per 1000 IDs.
+        batchModify returns no per-message payload, so every ID in a chunk shares the chunk's outcome.
+        """
+        logger.info("---GMAIL ACTION: Marking %s emails as spam---", len(email_ids))
+        results = []
+        for start in range(0, len(email_ids), self.BATCH_MODIFY_MAX_IDS):
+            chunk = email_ids[start:start + self.BATCH_MODIFY_MAX_IDS]
+            body = {'ids': chunk, **self.SPAM_LABEL_CHANGES}
+            try:
+                self.service.users().messages().batchModify(userId='me', body=body).execute()
+                logger.info("Successfully marked %s emails as spam.", len(chunk))
+                results.extend({"status": "success", "email_id": email_id, "result": {}} for email_id in chunk)
+            except HttpError as error:
+                logger.error("An error occurred while marking %s emails as spam: %s", len(chunk), error)
+                results.extend({"status": "error", "email_id": email_id, "error": str(error)} for email_id in chunk)
+            except Exception as e:
+                logger.error("An unexpected error occurred: %s", e)
+                results.extend({"status": "error", "email_id": email_id, "error": str(e)} for email_id in chunk)
+        return results
+
+    def mark_many_as_spam_with_results(self, email_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Marks several Gmail emails as spam through batch HTTP requests (up to 100 modify calls each).
+        Slower than mark_many_as_spam, but returns each message's own result or error.
+        """
+        logger.info("---GMAIL ACTION: Marking %s emails as spam (per-message results)---", len(email_ids))
+        unique_ids = list(dict.fromkeys(email_ids))
+        results: Dict[str, Dict[str, Any]] = {}
+
+        def _on_response(request_id: str, response: Any, exception: Exception) -> None:
+            if exception is not None:
+                logger.error("An error occurred while marking email %s as spam: %s", request_id, exception)
+                results[request_id] = {"status": "error", "email_id": request_id, "error": str(exception)}
+            else:
+                results[request_id] = {"status": "success", "email_id": request_id, "result": response}
+
+        for start in range(0, len(unique_ids), self.BATCH_HTTP_MAX_REQUESTS):
+            chunk = unique_ids[start:start + self.BATCH_HTTP_MAX_REQUESTS]
+            batch = self.service.new_batch_http_request(callback=_on_response)
+            for email_id in chunk:
+                request = self.service.users().messages().modify(userId='me', id=email_id, body=self.SPAM_LABEL_CHANGES)
+                batch.add(request, request_id=email_id)
+            try:
+                batch.execute()
+            except Exception as e:
+                logger.error("An unexpected error occurred executing the batch request: %s", e)
+                for email_id in chunk:
+                    results.setdefault(email_id, {"status": "error", "email_id": email_id, "error": str(e)})
+        return [results[email_id] for email_id in email_ids]
+
 
 class OutlookActions(BaseEmailActions):
     """Concrete implementation of email actions for the Microsoft Graph API."""
 
     GRAPH_API_ENDPOINT = "https://graph.microsoft.com/v1.0"
+    # Microsoft Graph JSON batching accepts at most 20 sub-requests per call
+    BATCH_MAX_REQUESTS = 20
+    # $batch calls kept in flight at once when a flush spans several batches
+    BATCH_MAX_CONCURRENCY = 4
 
     def __init__(self, client: requests.Session):
         if not client:
             raise ValueError("Outlook client (requests.Session) is required.")
         self.client = client
+        self._mount_connection_pool()
+
+    def _mount_connection_pool(self):
+        """
+        Mounts a pooled, retrying adapter for Graph calls on the shared session so that
+        bursts of actions reuse warm keep-alive connections instead of re-doing TLS handshakes.
+        The session outlives this client, so the adapter is only mounted once.
+        Only GET is retried: a retried move POST or $batch could repeat moves that already succeeded.
+        Throttled (429) GETs wait for the Retry-After delay Graph sends.
+        """
+        if self.GRAPH_API_ENDPOINT in self.client.adapters:
+            return
+        retry = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+            respect_retry_after_header=True
+        )
+        adapter = HTTPAdapter(pool_connections=20, pool_maxsize=50, max_retries=retry)
+        self.client.mount(self.GRAPH_API_ENDPOINT, adapter)
+        self.client.headers.update({"Connection": "keep-alive"})
 
     def mark_as_spam(self, email_id: str) -> Dict[str, Any]:
         """Moves an Outlook email to the 'junkemail' folder."""
-        logger.info(f"---OUTLOOK ACTION: Moving email {email_id} to Junk folder---")
+        logger.info("---OUTLOOK ACTION: Moving email %s to Junk folder---", email_id)
         move_endpoint = f"{self.GRAPH_API_ENDPOINT}/me/messages/{email_id}/move"
         payload = {"destinationId": "junkemail"}
         try:
-            response = self.client.post(move_endpoint, json=payload)
+            response = self.client.post(move_endpoint, data=json_dumps(payload), headers=JSON_HEADERS)
             response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-            logger.info(f"Successfully moved email {email_id} to Junk folder.")
-            return {"status": "success", "email_id": email_id, "result": response.json()}
+            logger.info("Successfully moved email %s to Junk folder.", email_id)
+            return {"status": "success", "email_id": email_id, "result": json_loads(response.content) if response.content else {}}
         except requests.exceptions.RequestException as e:
-            logger.error(f"An error occurred moving email {email_id} to Junk: {e}")
+            logger.error("An error occurred moving email %s to Junk: %s", email_id, e)
+            return {"status": "error", "email_id": email_id, "error": str(e)}
+        except Exception as e:
+            logger.error("An unexpected error occurred: %s", e)
             return {"status": "error", "email_id": email_id, "error": str(e)}
+
+    def mark_many_as_spam(self, email_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Moves several Outlook emails to the 'junkemail' folder using Graph JSON batching,
+        so every 20 moves cost a single round-trip to the $batch endpoint. Flushes larger than
+        one batch send up to BATCH_MAX_CONCURRENCY $batch requests in parallel.
+        """
+        logger.info("---OUTLOOK ACTION: Moving %s emails to Junk folder---", len(email_ids))
+        chunks = [
+            email_ids[start:start + self.BATCH_MAX_REQUESTS]
+            for start in range(0, len(email_ids), self.BATCH_MAX_REQUESTS)
+        ]
+        if len(chunks) <= 1:
+            return [result for chunk in chunks for result in self._move_batch_to_junk(chunk)]
+
+        # The calls are network-bound, so several $batch requests share the pooled session concurrently
+        with ThreadPoolExecutor(max_workers=min(self.BATCH_MAX_CONCURRENCY, len(chunks))) as executor:
+            chunk_results = executor.map(self._move_batch_to_junk, chunks)
+            return [result for results in chunk_results for result in results]
+
+    def _move_batch_to_junk(self, email_ids: List[str]) -> List[Dict[str, Any]]:
+        """Sends one $batch request moving up to 20 emails to Junk and maps each sub-response back to its email ID."""
+        batch_payload = {
+            "requests": [
+                {
+                    "id": str(i),
+                    "method": "POST",
+                    "url": f"/me/messages/{email_id}/move",
+                    "body": {"destinationId": "junkemail"},
+                    "headers": {"Content-Type": "application/json"}
+                }
+                for i, email_id in enumerate(email_ids)
+            ]
+        }
+        try:
+            response = self.client.post(
+                f"{self.GRAPH_API_ENDPOINT}/$batch", data=json_dumps(batch_payload), headers=JSON_HEADERS
+            )
+            response.raise_for_status()
+            sub_responses = {item.get("id"): item for item in json_loads(response.content).get("responses", [])}
+        except requests.exceptions.RequestException as e:
+            logger.error("An error occurred moving %s emails to Junk: %s", len(email_ids), e)
+            return [{"status": "error", "email_id": email_id, "error": str(e)} for email_id in email_ids]
         except Exception as e:
-            logger.error(f"An unexpected error occurred: {e}")
-            return {"status": "error", "email_id": email_id, "error": str(e)}
\ No newline at end of file
+            logger.error("An unexpected error occurred: %s", e)
+            return [{"status": "error", "email_id": email_id, "error": str(e)} for email_id in email_ids]
+
+        results = []
+        for i, email_id in enumerate(email_ids):
+            sub_response = sub_responses.get(str(i))
+            if sub_response is None:
+                error = "No response returned for batched request."
+            elif 200 <= sub_response.get("status", 0) < 300:
+                logger.info("Successfully moved email %s to Junk folder.", email_id)
+                results.append({"status": "success", "email_id": email_id, "result": sub_response.get("body", {})})
+                continue
+            else:
+                body = sub_response.get("body") or {}
+                error = body.get("error", {}).get("message") or f"HTTP {sub_response.get('status')}"
+            logger.error("An error occurred moving email %s to Junk: %s", email_id, error)
+            results.append({"status": "error", "email_id": email_id, "error": error})
+        return results
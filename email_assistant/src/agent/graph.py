@@ -1,16 +1,24 @@
+import hashlib
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
+from langgraph.types import CachePolicy
+from langgraph.cache.memory import InMemoryCache
 import requests
 from functools import partial
-from email_assistant.src.agent.state import EmailAgentState
+from email_assistant.src.agent.state import EmailAgentState, EmailProcessingOutput, EmailProcessingState
 from email_assistant.src.logger import logger
 from email_assistant.src.config import config
+from email_assistant.src.llm_factory import LLMFactory
+from email_assistant.src.serialization import json_dumps
 from email_assistant.src.agent.nodes import (
     fetch_emails_node, 
-    select_next_email_node, 
     update_run_state_node, 
+    classify_inbox_node,
+    dispatch_emails,
     classify_email_node,
-    simple_triage_node
+    classify_email_fallback_node,
+    simple_triage_node,
+    finish_email_node
 )
 from email_assistant.src.agent.planner_nodes import (
     meeting_planner,
@@ -18,7 +26,7 @@ from email_assistant.src.agent.planner_nodes import (
     invoice_planner,
     general_planner
 )
-from email_assistant.src.agent.plan_step_node import plan_step_node
+from email_assistant.src.agent.plan_step_node import plan_step_node, plan_step_retry_node
 from email_assistant.src.agent.tools import placeholder_tool
 from email_assistant.src.tools.email_fetcher import BaseEmailFetcher
 from email_assistant.src.tools.outlook_fetcher import OutlookFetcher
@@ -26,79 +34,33 @@ from email_assistant.src.tools.calendar_tools import OutlookCalendarTool
 from langchain_core.runnables.graph_png import PngDrawer
 from email_assistant.src.utils import get_tools
 
-def check_for_emails_node(state: EmailAgentState) -> EmailAgentState:
-    """Dummy node to serve as the entry point for the email processing loop."""
-    return state
-
-
-# Conditional Edge Functions
-def did_fetch_emails(state: EmailAgentState) -> str:
-    """
-    Checks if the fetch_emails_node actually retrieved any emails.
-    """
-    logger.info("---COND: CHECKING IF EMAILS WERE FETCHED---")
-    if state.get('inbox') and len(state.get('inbox')) > 0:
-        logger.info("Emails fetched successfully. Starting processing.")
-        return "continue"
-    else:
-        logger.info("No new emails found. Ending workflow.")
-        return "end"
-
-
-def has_emails_to_process(state: EmailAgentState) -> str:
+def classification_cache_key(state: EmailProcessingState) -> str:
     """
-    Determines the next step based on batch status and fetch cycle limit.
+    Cache key for classify_email: a digest of the email content the classification depends on,
+    so repeated or identical emails (e.g. recurring newsletters) skip the LLM entirely. The label
+    dispatched by the batched classification is part of the key, so it is never overridden by a cached one.
     """
-    logger.info("---COND: CHECKING FOR MORE EMAILS---")
-    current_index = state.get('current_email_index', 0)
-    inbox_size = len(state.get('inbox', []))
-
-    # Check if there are emails left in the current batch
-    if current_index < inbox_size:
-        logger.info(f"Emails to process in batch. Current index: {current_index}, Inbox size: {inbox_size}")
-        return "continue"
-
-    # If batch is finished, check if we should fetch a new one
-    fetch_emails_run_count = state.get('fetch_emails_run_count', 0)
-    if fetch_emails_run_count < config.max_fetch_cycles:
-        logger.info(f"Batch finished. Fetch count {fetch_emails_run_count}/{config.max_fetch_cycles}. Fetching new batch.")
-        return "fetch_new"
-    else:
-        logger.info(f"Batch finished and fetch limit of {config.max_fetch_cycles} reached. Ending workflow.")
-        return "end_workflow"
+    current_email = state.get('current_email') or {}
+    content = "\n".join((
+        state.get('classification') or '',
+        current_email.get('sender', ''),
+        current_email.get('subject', ''),
+        current_email.get('body', '')
+    ))
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
 
 
-def route_after_classification(state: EmailAgentState) -> str:
+def plan_step_cache_key(state: EmailProcessingState) -> str:
     """
-    Routes to the appropriate specialized planner based on classification.
+    Cache key for plan_step: a digest of the message history the LLM decision depends on. Identical
+    emails (recurring invites, templated invoices) produce identical planner prompts, so their
+    reasoning steps are answered from the cache. Tool call IDs are left out as they differ per response.
     """
-    classification = state.get('classification')
-    logger.info(f"---COND: ROUTING BASED ON CLASSIFICATION: {classification}---")
-    
-    if classification == "meeting":
-        return "meeting_planner"
-    elif classification == "task":
-        return "task_planner"
-    elif classification == "invoice":
-        return "invoice_planner"
-    elif classification in ["spam", "newsletter"]:
-        return "simple_triage"
-    else: # "priority", "other", or None
-        return "general_planner"
-
-
-def should_continue(state: EmailAgentState) -> str:
-    """Determines whether to continue the reasoning loop or finish."""
-    logger.info("---COND: CHECKING FOR TOOL CALLS---")
-    if not state.get('messages'):
-        return "end_of_email"
-    last_message = state['messages'][-1]
-    # Check if the last message is an AIMessage and if it has tool calls
-    if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
-        logger.info("Tool call detected, routing to tool execution.")
-        return "execute_tools"
-    logger.info("No tool call, finishing email processing.")
-    return "end_of_email"
+    digest = hashlib.blake2b(digest_size=16)
+    for message in state.get('messages', []):
+        tool_calls = [(call['name'], call['args']) for call in getattr(message, 'tool_calls', None) or []]
+        digest.update(json_dumps([message.type, message.content, tool_calls]))
+    return digest.hexdigest()
 
 
 def custom_tool_error_handler(e: Exception) -> str:
@@ -120,87 +82,94 @@ def custom_tool_error_handler(e: Exception) -> str:
         "Do not retry the tool. Inform the user about the failure and stop."
     )
 
-def build_agent_workflow_graph(email_fetcher: BaseEmailFetcher = None) -> StateGraph:
+def build_email_processing_graph(email_fetcher: BaseEmailFetcher = None):
     """
-    Builds and compiles the LangGraph workflow for the email agent.
+    Builds and compiles the process_email subgraph, which takes a single email from classification
+    through planning and tool execution. Only processed_email_ids and pending_spam_ids are handed
+    back to the batch graph, and both merge through reducers, so sibling runs never conflict.
     """
-    workflow = StateGraph(EmailAgentState)
-    fetch_emails_node_runnable = partial(fetch_emails_node, email_fetcher=email_fetcher)
-    
-    # Define tools
-    tools = get_tools(email_fetcher)    
+    workflow = StateGraph(EmailProcessingState, output_schema=EmailProcessingOutput)
+
+    # Define tools once; the planner's LLM binding and the ToolNode share the same list
+    tools = get_tools(email_fetcher)
+    llm_with_tools = LLMFactory.get_instance().bind_tools(tools)
+    plan_step_node_runnable = partial(plan_step_node, llm_with_tools=llm_with_tools)
     # Add nodes
-    workflow.add_node("fetch_emails", fetch_emails_node_runnable)
-    workflow.add_node("check_for_emails", check_for_emails_node)
-    workflow.add_node("select_next_email", select_next_email_node)
-    workflow.add_node("classify_email", classify_email_node)
-    workflow.add_node("simple_triage", simple_triage_node)
-    workflow.add_node("update_run_state", update_run_state_node)
+    workflow.add_node(
+        "classify_email",
+        classify_email_node,
+        cache_policy=CachePolicy(key_func=classification_cache_key, ttl=config.classification_cache_ttl)
+    )
+    # Not cached: it only runs when classify_email's LLM call failed
+    workflow.add_node("classify_email_fallback", classify_email_fallback_node)
+    # The fetcher is bound here so the node shares its cached action client rather than reading one from state
+    workflow.add_node("simple_triage", partial(simple_triage_node, email_fetcher=email_fetcher))
+    workflow.add_node("finish_email", finish_email_node)
     # Planner nodes
     workflow.add_node("meeting_planner", meeting_planner)
     workflow.add_node("task_planner", task_planner)
     workflow.add_node("invoice_planner", invoice_planner)
     workflow.add_node("general_planner", general_planner)
     # Core reasoning nodes
-    workflow.add_node("plan_step", plan_step_node)
-    # The ToolNode is now wrapped in a function that gets tools dynamically from the state
-    # This ensures the execution node and planning node are always in sync.
-    dynamic_tool_node = ToolNode(tools=tools, handle_tool_errors=custom_tool_error_handler)
-    workflow.add_node("execute_tools", dynamic_tool_node)
-    # Set the entry point
-    workflow.set_entry_point("fetch_emails")
-    # Core Graph Edges
-    workflow.add_conditional_edges(
-        "fetch_emails",
-        did_fetch_emails,
-        {
-            "continue": "check_for_emails", 
-            "end": END
-        }
-    )
-    workflow.add_conditional_edges(
-        "check_for_emails",
-        has_emails_to_process,
-        {
-            "continue": "select_next_email", 
-            "fetch_new": "fetch_emails", 
-            "end_workflow": END
-        }
+    # partial() hides the node's Command return annotation, so its destinations are declared explicitly
+    workflow.add_node(
+        "plan_step",
+        plan_step_node_runnable,
+        destinations=("execute_tools", "finish_email", "plan_step_retry"),
+        cache_policy=CachePolicy(key_func=plan_step_cache_key, ttl=config.plan_step_cache_ttl)
     )
-    workflow.add_edge("select_next_email", "classify_email")
-    # Routing after classification
-    workflow.add_conditional_edges(
-        "classify_email",
-        route_after_classification,
-        {
-            "meeting_planner": "meeting_planner",
-            "task_planner": "task_planner",
-            "invoice_planner": "invoice_planner",
-            "general_planner": "general_planner",
-            "simple_triage": "simple_triage"
-        }
+    # Not cached: it only runs when plan_step's LLM call failed
+    workflow.add_node(
+        "plan_step_retry",
+        partial(plan_step_retry_node, llm_with_tools=llm_with_tools),
+        destinations=("execute_tools", "finish_email")
     )
-    # Edges from simple triage back to the main loop
-    workflow.add_edge("simple_triage", "update_run_state")
+    tool_node = ToolNode(tools=tools, handle_tool_errors=custom_tool_error_handler)
+    workflow.add_node("execute_tools", tool_node)
+    # Set the entry point
+    workflow.set_entry_point("classify_email")
+    # classify_email routes to its planner itself via Command(goto=...)
+    workflow.add_edge("simple_triage", "finish_email")
     # Connect planners to the main reasoning step
     workflow.add_edge("meeting_planner", "plan_step")
     workflow.add_edge("task_planner", "plan_step")
     workflow.add_edge("invoice_planner", "plan_step")
     workflow.add_edge("general_planner", "plan_step")
-    # The core reasoning loop
-    workflow.add_conditional_edges(
-        "plan_step",
-        should_continue,
-        {
-            "execute_tools": "execute_tools",
-            "end_of_email": "update_run_state"
-        }
-    )
+    # The core reasoning loop: plan_step routes to execute_tools or finish_email via Command(goto=...)
     workflow.add_edge("execute_tools", "plan_step")
-    # After processing an email, loop back to check for the next one
-    workflow.add_edge("update_run_state", "check_for_emails")
-    # Compile the graph
-    agent_workflow_graph = workflow.compile()
+    workflow.add_edge("finish_email", END)
+    return workflow.compile(cache=InMemoryCache())
+
+
+def build_agent_workflow_graph(email_fetcher: BaseEmailFetcher = None) -> StateGraph:
+    """
+    Builds and compiles the LangGraph workflow for the email agent.
+    """
+    workflow = StateGraph(EmailAgentState)
+    fetch_emails_node_runnable = partial(fetch_emails_node, email_fetcher=email_fetcher)
+
+    # Add nodes
+    # partial() hides the node's Command return annotation, so its destinations are declared explicitly
+    workflow.add_node("fetch_emails", fetch_emails_node_runnable, destinations=("classify_inbox", END))
+    workflow.add_node("classify_inbox", classify_inbox_node)
+    workflow.add_node("process_email", build_email_processing_graph(email_fetcher))
+    workflow.add_node(
+        "update_run_state",
+        partial(update_run_state_node, email_fetcher=email_fetcher),
+        destinations=("fetch_emails", END)
+    )
+    # Set the entry point
+    workflow.set_entry_point("fetch_emails")
+    # Core Graph Edges
+    # fetch_emails routes to classify_inbox (or END when nothing was fetched) via Command(goto=...)
+    # Every classified email is sent to its own process_email run; the runs execute concurrently.
+    # Planner prompts are deliberately not merged across emails: tool calls and their results must stay
+    # attributable to a single email, so concurrency overlaps the round-trips instead of sharing one call
+    workflow.add_conditional_edges("classify_inbox", dispatch_emails, ["process_email"])
+    # update_run_state runs once all runs of the batch have finished, then routes to a new fetch or END itself
+    workflow.add_edge("process_email", "update_run_state")
+    # Compile the graph, capping how many emails are processed at once
+    agent_workflow_graph = workflow.compile().with_config(max_concurrency=config.email_max_concurrency)
     logger.info("Email agent workflow graph compiled successfully!")
     return agent_workflow_graph
 
@@ -223,15 +192,11 @@ if __name__ == '__main__':
     initial_state: EmailAgentState = {
         "fetch_emails_run_count": 0,
         "inbox": [],
-        "current_email_index": 0,
-        "processed_email_ids": [],
-        "current_email": None,
-        "classification": None,
-        "summary": None,
-        "extracted_data": None,
-        "messages": [],
-        "user_preferences": None,
-        "email_actions_client": None
+        "inbox_size": 0,
+        "classifications": [],
+        "processed_email_ids": set(),
+        "pending_spam_ids": [],
+        "user_preferences": None
     }
     # Run the graph with the initial state
     final_state = email_agent.invoke(initial_state, config={"recursion_limit": 50})
@@ -1,11 +1,44 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import cache, lru_cache
+from typing import List, Literal, Optional, get_args
 from email_assistant.src.tools.email_fetcher import BaseEmailFetcher, GmailFetcher
 from email_assistant.src.tools.outlook_fetcher import OutlookFetcher
-from email_assistant.src.agent.state import EmailAgentState, UserPreferences
+from email_assistant.src.agent.state import Email, EmailAgentState, EmailProcessingState, UserPreferences
+from email_assistant.src.data_models import EmailCategory, EmailClassification
 from email_assistant.src.logger import logger
 from email_assistant.src.config import config
-from email_assistant.src.llm_factory import llm
-from email_assistant.src.agent.email_actions import GmailActions, OutlookActions
+from email_assistant.src.llm_factory import LLMFactory
+from email_assistant.src.agent.email_actions import BaseEmailActions, GmailActions, OutlookActions
 from email_assistant.src.prompts.prompt_manager import prompt_manager
+from email_assistant.src.serialization import json_dumps, json_loads
+from langchain_core.messages import HumanMessage
+from langgraph.graph import END
+from langgraph.types import Command, Send
+
+_VALID_CATEGORIES = frozenset(get_args(EmailCategory))
+# Planner node for each classification; anything else ("priority", "other") goes to general_planner
+_CLASSIFICATION_ROUTES = {
+    "meeting": "meeting_planner",
+    "task": "task_planner",
+    "invoice": "invoice_planner",
+    "spam": "simple_triage",
+    "newsletter": "simple_triage"
+}
+# Matches the JSON array in the batched classification reply, even if wrapped in markdown fences
+_JSON_ARRAY_RE = re.compile(r"\[.*\]", re.S)
+# Precompiled cleanup applied to emails before classification: tags, quoted reply tails and Re:/Fwd: prefixes
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+_QUOTED_TAIL_RE = re.compile(r"^(?:>|On [^\n]* wrote:).*", re.M | re.S)
+_REPLY_PREFIX_RE = re.compile(r"^(?:(?:re|fwd?)\s*:\s*)+", re.I)
+
+
+# Maps next_batch_route outcomes to the node that handles them
+BATCH_ROUTES = {
+    "fetch_new": "fetch_emails",
+    "end_workflow": END
+}
 
 def load_user_preferences() -> UserPreferences:
     """Load user preferences with default values. This can be extended to load from config files or database."""
@@ -19,167 +52,330 @@ def load_user_preferences() -> UserPreferences:
     )
 
 
+@cache
+def _classify_chain():
+    """
+    Builds the single-email classification chain on first use, so importing this module does not create the LLM.
+    The static system prompt comes first so the provider can cache the prefix; the reply is decoded under the
+    provider's schema constraint and parsed straight into EmailClassification.
+    """
+    return prompt_manager.get_classify_email_chat_prompt() | LLMFactory.get_instance().with_structured_output(
+        EmailClassification, **LLMFactory.structured_output_kwargs()
+    )
+
+
+@lru_cache(maxsize=4)
+def _build_email_actions_client(fetcher_type: type, service) -> Optional[BaseEmailActions]:
+    """Builds the provider-specific action client for a fetcher connection."""
+    if issubclass(fetcher_type, GmailFetcher):
+        logger.info("Initialized GmailActions client.")
+        return GmailActions(service=service)
+    if issubclass(fetcher_type, OutlookFetcher):
+        logger.info("Initialized OutlookActions client.")
+        return OutlookActions(client=service)
+    logger.warning("No email actions client available for fetcher type %s.", fetcher_type.__name__)
+    return None
+
+
+def get_email_actions_client(email_fetcher: Optional[BaseEmailFetcher]) -> Optional[BaseEmailActions]:
+    """
+    Returns the action client for the fetcher's current connection. The client is built once per
+    connection and reused for every email, instead of being created per fetch and carried in state.
+    """
+    if email_fetcher is None or email_fetcher.service is None:
+        return None
+    return _build_email_actions_client(type(email_fetcher), email_fetcher.service)
+
+
 # Node Functions
 def fetch_emails_node(
         state: EmailAgentState,
         email_fetcher: BaseEmailFetcher = None
-) -> EmailAgentState:
-    """Fetches unread emails, increments the fetch counter, and initializes the action client."""
+) -> Command[Literal["classify_inbox", "__end__"]]:
+    """
+    Fetches unread emails and increments the fetch counter.
+    Routes to classification when emails were fetched, otherwise ends the workflow.
+    """
     # Increment fetch counter and log
     fetch_count = state.get('fetch_emails_run_count', 0) + 1
-    state['fetch_emails_run_count'] = fetch_count
-    logger.info(f"---NODE: FETCHING EMAILS (Cycle {fetch_count}/{config.max_fetch_cycles})---")
+    logger.info("---NODE: FETCHING EMAILS (Cycle %s/%s)---", fetch_count, config.max_fetch_cycles)
+
+    logger.info("Connecting and fetching up to %s unread emails...", config.max_emails_to_fetch)
 
-    logger.info(f"Connecting and fetching up to {config.max_emails_to_fetch} unread emails...")
+    # Only the channels written here are returned, so untouched channels are not re-persisted
+    update = {
+        'fetch_emails_run_count': fetch_count,
+        # Formatted once per batch instead of once per planner call
+        'run_date': datetime.now().strftime("%Y-%m-%d")
+    }
 
     # Initialize user preferences if not already set
     if 'user_preferences' not in state or state['user_preferences'] is None:
-        state['user_preferences'] = load_user_preferences()
+        update['user_preferences'] = load_user_preferences()
         logger.info("Initialized user preferences in agent state")
 
-    # Store the fetcher in the state so other nodes can access it
-    state['email_fetcher'] = email_fetcher
-
     try:
-        fetched_emails = email_fetcher.get_emails(max_count=config.max_emails_to_fetch)
-        
-        # Initialize the appropriate provider-specific action client
-        if isinstance(email_fetcher, GmailFetcher):
-            state['email_actions_client'] = GmailActions(service=email_fetcher.service)
-            logger.info("Initialized GmailActions client in state.")
-        elif isinstance(email_fetcher, OutlookFetcher):
-            state['email_actions_client'] = OutlookActions(client=email_fetcher.service)
-            logger.info("Initialized OutlookActions client in state.")
-        else:
-            state['email_actions_client'] = None
-            logger.warning("No email actions client initialized for the current fetcher type.")
-
+        # Emails processed in an earlier cycle stay unread, so they are excluded instead of downloaded again
+        fetched_emails = email_fetcher.get_emails(
+            max_count=config.max_emails_to_fetch,
+            exclude_ids=state.get('processed_email_ids') or ()
+        )
     except Exception as e:
-        logger.error("Failed to fetch emails or initialize action client: %s", e)
+        logger.error("Failed to fetch emails: %s", e)
         fetched_emails = []
-        state['email_actions_client'] = None
 
     # Update the state
-    state['inbox'] = fetched_emails
-    state['current_email_index'] = 0
-    logger.info(f"Fetched {len(fetched_emails)} emails.")
-    return state
+    update['inbox'] = fetched_emails
+    update['inbox_size'] = len(fetched_emails)
+    logger.info("Fetched %s emails.", len(fetched_emails))
+    if not fetched_emails:
+        logger.info("No new emails found. Ending workflow.")
+        return Command(update=update, goto=END)
+    return Command(update=update, goto="classify_inbox")
+
+
+def next_batch_route(state: EmailAgentState) -> str:
+    """
+    Determines whether to fetch another batch once the current one is processed, based on the fetch cycle limit.
+    """
+    fetch_emails_run_count = state.get('fetch_emails_run_count', 0)
+    if fetch_emails_run_count < config.max_fetch_cycles:
+        logger.info("Batch finished. Fetch count %s/%s. Fetching new batch.", fetch_emails_run_count, config.max_fetch_cycles)
+        return "fetch_new"
+    logger.info("Batch finished and fetch limit of %s reached. Ending workflow.", config.max_fetch_cycles)
+    return "end_workflow"
 
 
-def select_next_email_node(state: EmailAgentState) -> EmailAgentState:
-    """Selects the next email from the inbox and prepares the state for processing."""
-    logger.info("---NODE: SELECTING NEXT EMAIL---")
-    current_index = state.get('current_email_index', 0)
+def dispatch_emails(state: EmailAgentState) -> List[Send]:
+    """
+    Fans the batch out to one process_email run per email. The runs share no per-email state,
+    so LangGraph executes them concurrently in a single superstep.
+    """
     inbox = state.get('inbox', [])
-    if current_index < len(inbox):
-        # Set the current email
-        state['current_email'] = inbox[current_index]
-        state['current_email_index'] = current_index + 1
-        # Clear per-email state fields for the new email
-        state['classification'] = None
-        state['summary'] = None
-        state['extracted_data'] = None
-        state['messages'] = []  # Reset conversation history for new email
-        logger.info(f"Selected email {current_index + 1}/{len(inbox)}: {state['current_email']['subject']}")
-    else:
-        logger.warning("No more emails to process, but select_next_email was called")
+    classifications = state.get('classifications') or []
+    logger.info("Dispatching %s emails for concurrent processing", len(inbox))
+    return [
+        Send("process_email", {
+            "current_email": email,
+            "classification": classifications[i] if i < len(classifications) else None,
+            "user_preferences": state.get('user_preferences'),
+            "run_date": state.get('run_date')
+        })
+        for i, email in enumerate(inbox)
+    ]
 
-    return state
 
+def finish_email_node(state: EmailProcessingState) -> dict:
+    """Records the current email as processed; the merge_email_ids reducer unions it into the run's IDs."""
+    current_email = state.get('current_email')
+    if not current_email or 'id' not in current_email:
+        return {}
+    logger.info("Added email ID %s to processed list", current_email['id'])
+    return {"processed_email_ids": {current_email['id']}}
 
-def update_run_state_node(state: EmailAgentState) -> EmailAgentState:
+
+def update_run_state_node(
+        state: EmailAgentState,
+        email_fetcher: BaseEmailFetcher = None
+) -> Command[Literal["fetch_emails", "__end__"]]:
     """
-    Updates the run state after processing an email - clears per-email fields and tracks processed emails.
+    Updates the run state once every email in the batch has been processed - flushes the spam buffered
+    by simple_triage_node in one bulk call, then routes to a new fetch or the end of the workflow.
     """
     logger.info("---NODE: UPDATING RUN STATE---")
-    # Add the current email ID to processed list if it exists
-    current_email = state.get('current_email')
-    if current_email and 'id' in current_email:
-        processed_ids = state.get('processed_email_ids', [])
-        if current_email['id'] not in processed_ids:
-            processed_ids.append(current_email['id'])
-            state['processed_email_ids'] = processed_ids
-            logger.info(f"Added email ID {current_email['id']} to processed list")
-
-    # Clear per-email fields for the next iteration
-    state['current_email'] = None
-    state['classification'] = None
-    state['summary'] = None
-    state['extracted_data'] = None
-    # Reset conversation history
-    state['messages'] = []
-
-    logger.info("Cleared per-email state fields for next iteration")
-    return state
-
-
-def classify_email_node(state: EmailAgentState) -> EmailAgentState:
-    """Classifies the current email using LLM integration."""
-    logger.info("---NODE: CLASSIFYING EMAIL---")
+    update = {}
+    pending_spam_ids = state.get('pending_spam_ids') or []
+    if pending_spam_ids:
+        email_actions_client = get_email_actions_client(email_fetcher)
+        if email_actions_client:
+            email_actions_client.mark_many_as_spam(pending_spam_ids)
+        else:
+            logger.error("No email actions client available. Cannot mark buffered emails as spam.")
+        # None tells the append_email_ids reducer to clear the buffer
+        update["pending_spam_ids"] = None
+
+    return Command(update=update, goto=BATCH_ROUTES[next_batch_route(state)])
+
+
+def _parse_inbox_classifications(content: str, inbox_size: int) -> List[Optional[str]]:
+    """Parses the batched classification reply into one label per inbox email, None where missing or invalid."""
+    classifications: List[Optional[str]] = [None] * inbox_size
+    match = _JSON_ARRAY_RE.search(content)
+    if not match:
+        logger.warning("Batched classification reply did not contain a JSON array")
+        return classifications
+    for item in json_loads(match.group(0)):
+        if not isinstance(item, dict):
+            continue
+        index = item.get('i')
+        label = str(item.get('label', '')).strip().lower()
+        if isinstance(index, int) and 0 <= index < inbox_size and label in _VALID_CATEGORIES:
+            classifications[index] = label
+    return classifications
+
+
+def _classification_subject(email: Email) -> str:
+    """Returns the email subject without reply/forward prefixes."""
+    return _REPLY_PREFIX_RE.sub('', email.get('subject') or '')
+
+
+def _classification_body(email: Email) -> str:
+    """
+    Returns a short preview of the email body for the classifier: HTML tags and the quoted
+    reply tail are stripped, then the text is cut to config.classify_body_chars characters.
+    """
+    body = _HTML_TAG_RE.sub(' ', email.get('body') or '')
+    body = _QUOTED_TAIL_RE.sub('', body)
+    return body.strip()[:config.classify_body_chars]
+
+
+def _classify_inputs(email: Email) -> dict:
+    """Builds the single-email classification prompt variables."""
+    return {
+        "sender": email.get('sender', ''),
+        "email_subject": _classification_subject(email),
+        "email_body": _classification_body(email)
+    }
+
+
+def _classify_email(email: Email) -> Optional[str]:
+    """Classifies one email with a dedicated LLM call, returning None if the call fails."""
+    try:
+        return _classify_chain().invoke(_classify_inputs(email)).label
+    except Exception as e:
+        logger.error("Failed to classify email %s: %s", email.get('id'), e)
+        return None
+
+
+def _classify_emails(emails: List[Email]) -> List[Optional[str]]:
+    """
+    Classifies emails with one LLM call each, issued concurrently from a thread pool. The pool caps the
+    requests in flight at config.llm_max_concurrency to stay within provider rate limits. Threads are used
+    rather than a per-call event loop, as the shared LLM client keeps async state bound to its first loop.
+    """
+    if len(emails) <= 1:
+        return [_classify_email(email) for email in emails]
+    # The calls are network-bound, so the threads overlap their round-trips
+    with ThreadPoolExecutor(max_workers=min(config.llm_max_concurrency, len(emails))) as executor:
+        return list(executor.map(_classify_email, emails))
+
+
+def classify_inbox_node(state: EmailAgentState) -> dict:
+    """Classifies every email in the fetched batch with a single LLM call."""
+    logger.info("---NODE: CLASSIFYING INBOX---")
+    inbox = state.get('inbox', [])
+    classifications: List[Optional[str]] = [None] * len(inbox)
+    if inbox:
+        emails = [
+            {
+                "i": i,
+                "sender": email.get('sender', ''),
+                "subject": _classification_subject(email),
+                "body": _classification_body(email)
+            }
+            for i, email in enumerate(inbox)
+        ]
+        try:
+            prompt = [HumanMessage(content=prompt_manager.format(
+                "CLASSIFY_INBOX_PROMPT", emails_json=json_dumps(emails).decode("utf-8")
+            ))]
+            response = LLMFactory.get_instance().invoke(prompt)
+            classifications = _parse_inbox_classifications(response.content, len(inbox))
+            logger.info("Classified inbox in one call: %s", classifications)
+        except Exception as e:
+            logger.error("Failed to classify inbox in one call, emails will be classified individually: %s", e)
+
+    # Emails the batched call could not resolve (bad reply, context overflow) are classified concurrently
+    unresolved = [i for i, classification in enumerate(classifications) if classification is None]
+    if unresolved:
+        logger.info("Classifying %s emails with concurrent per-email LLM calls", len(unresolved))
+        results = _classify_emails([inbox[i] for i in unresolved])
+        for i, classification in zip(unresolved, results):
+            classifications[i] = classification
+
+    return {"classifications": classifications}
+
+
+def _route_classification(classification: str) -> Command:
+    """Stores the classification and routes to the matching planner in a single step."""
+    goto = _CLASSIFICATION_ROUTES.get(classification, "general_planner")
+    logger.debug("---ROUTING BASED ON CLASSIFICATION: %s---", classification)
+    return Command(update={"classification": classification}, goto=goto)
+
+
+def classify_email_node(
+        state: EmailProcessingState
+) -> Command[Literal["meeting_planner", "task_planner", "invoice_planner", "general_planner", "simple_triage", "classify_email_fallback"]]:
+    """
+    Routes on the classification dispatched with the email by the batched inbox classification,
+    falling back to a dedicated LLM call when the batch left it unresolved.
+    Only the classification and route are returned, so the node's cached writes stay small and self-contained.
+    A failed LLM call is handed to classify_email_fallback, so only the route, never a default label, is cached.
+    """
+    logger.debug("---NODE: CLASSIFYING EMAIL---")
     current_email = state.get('current_email')
     if not current_email:
         logger.warning("No current email to classify")
-        state['classification'] = "other"
-        return state
+        return _route_classification("other")
 
-    email_subject = current_email.get('subject', '')
-    email_body = current_email.get('body', '')
-    sender = current_email.get('sender', '')
+    classification = state.get('classification')
+    if classification:
+        logger.info("Email classified as: %s", classification)
+        return _route_classification(classification)
 
     try:
-        # Get template and format it
-        classify_prompt_template = prompt_manager.get_prompt("CLASSIFY_EMAIL_PROMPT")
-        prompt = classify_prompt_template.format(
-            sender=sender,
-            email_subject=email_subject,
-            email_body=email_body
-        )
-        
-        # Invoke the LLM
-        response = llm.invoke(prompt)
-        classification = response.content.strip().lower()
-        
-        # More robust parsing to extract classification if model includes extra text
-        valid_categories = {"priority", "meeting", "task", "invoice", "newsletter", "spam", "other"}
-        for category in valid_categories:
-            if category in classification:
-                classification = category
-                break
-        else:
-            logger.warning(f"Invalid classification '{classification}' from LLM, defaulting to 'other'")
-            classification = "other"
-            
-        state['classification'] = classification
-        logger.info(f"Email classified as: {classification}")
+        classification = _classify_chain().invoke(_classify_inputs(current_email)).label
+        logger.info("Email classified as: %s", classification)
 
     except Exception as e:
-        logger.error(f"Failed to classify email: {e}")
-        state['classification'] = "other"
+        logger.error("Failed to classify email, retrying without the cache: %s", e)
+        return Command(goto="classify_email_fallback")
 
-    return state
+    return _route_classification(classification)
 
 
-def simple_triage_node(state: EmailAgentState) -> dict:
+def classify_email_fallback_node(
+        state: EmailProcessingState
+) -> Command[Literal["meeting_planner", "task_planner", "invoice_planner", "general_planner", "simple_triage"]]:
+    """
+    Retries the classification of an email whose LLM call failed in classify_email. This node is not
+    cached, so the "other" fallback used when the retry fails too is never replayed for later emails.
+    """
+    logger.debug("---NODE: CLASSIFYING EMAIL (FALLBACK)---")
+    try:
+        classification = _classify_chain().invoke(_classify_inputs(state['current_email'])).label
+        logger.info("Email classified as: %s", classification)
+
+    except Exception as e:
+        logger.error("Failed to classify email: %s", e)
+        classification = "other"
+
+    return _route_classification(classification)
+
+
+def simple_triage_node(state: EmailProcessingState, email_fetcher: BaseEmailFetcher = None) -> dict:
     """Handles simple triage cases by calling the appropriate action client method."""
     classification = state.get("classification")
     current_email = state.get("current_email")
-    email_actions_client = state.get("email_actions_client")
+    email_actions_client = get_email_actions_client(email_fetcher)
     email_id = current_email["id"]
     
-    logger.info(f"---NODE: PERFORMING SIMPLE TRIAGE for email {email_id} with classification: {classification} ---")
+    logger.debug("---NODE: PERFORMING SIMPLE TRIAGE for email %s with classification: %s ---", email_id, classification)
 
     if not email_actions_client:
-        logger.error("No email actions client found in state. Cannot perform email actions.")
+        logger.error("No email actions client available. Cannot perform email actions.")
         return {}
 
     if classification == "spam":
-        email_actions_client.mark_as_spam(email_id=email_id)
-        
+        # Buffer the ID; update_run_state_node marks the whole batch as spam in one call
+        logger.info("Action: Queuing email %s to be marked as spam.", email_id)
+        return {"pending_spam_ids": [email_id]}
+
     elif classification == "newsletter":
         # Placeholder for calling the tool to move or label the email
         # e.g., email_tools.move_email_to_folder(email_id, "Newsletters")
-        logger.info(f"Action: Archiving newsletter {email_id}.")
+        logger.info("Action: Archiving newsletter %s.", email_id)
 
     # This node performs a side-effect and doesn't need to modify the state.
-    # The subsequent `update_run_state` node will handle state cleanup.
+    # The subsequent `finish_email` node records the email as processed.
     return {}
@@ -1,34 +1,55 @@
-from email_assistant.src.agent.state import EmailAgentState
+from typing import Literal
+from email_assistant.src.agent.state import EmailProcessingState
 from langchain_core.messages import AIMessage, ToolMessage
-from email_assistant.src.llm_factory import llm
+from langchain_core.runnables import Runnable
+from langgraph.types import Command
 from email_assistant.src.logger import logger
-from email_assistant.src.utils import get_tools
 
-def plan_step_node(state: EmailAgentState) -> EmailAgentState:
+
+def _plan(messages, llm_with_tools: Runnable) -> Command[Literal["execute_tools", "finish_email"]]:
+    """Invokes the LLM with the message history and routes on whether it requested tool calls."""
+    response = llm_with_tools.invoke(messages)
+    logger.info("LLM response: %s", response.content)
+
+    # The `add_messages` reducer on the `messages` field will handle appending.
+    if getattr(response, 'tool_calls', None):
+        logger.info("Tool call detected, routing to tool execution.")
+        return Command(update={"messages": [response]}, goto="execute_tools")
+    logger.info("No tool call, finishing email processing.")
+    return Command(update={"messages": [response]}, goto="finish_email")
+
+
+def plan_step_node(
+        state: EmailProcessingState,
+        llm_with_tools: Runnable
+) -> Command[Literal["execute_tools", "finish_email", "plan_step_retry"]]:
     """
-    The core reasoning node for the ReAct agent.
+    The core reasoning node for the ReAct agent. Routes to tool execution when the LLM
+    requested tool calls, otherwise finishes the current email.
+    llm_with_tools is bound once in build_agent_workflow_graph to the same tools the ToolNode executes.
+    A failed LLM call is handed to plan_step_retry, so only successful responses are cached.
     """
-    logger.info("---NODE: PLANNING STEP---")
-    # Get the current messages and email_fetcher from the state
-    messages = state.get('messages', [])
-    # The email_fetcher is needed to determine which tools are available
-    email_fetcher = state.get('email_fetcher')
-    
-    tools = get_tools(email_fetcher)
-    llm_with_tools = llm.bind_tools(tools)
-
-    # Invoke the LLM with the message history and tools
+    logger.debug("---NODE: PLANNING STEP---")
     try:
-        response = llm_with_tools.invoke(messages)
-        logger.info(f"LLM response: {response.content}")
+        return _plan(state.get('messages', []), llm_with_tools)
+    except Exception as e:
+        logger.error("Error during planning step, retrying without the cache: %s", e)
+        return Command(goto="plan_step_retry")
 
-        # Return a dictionary where the key matches the state field.
-        # The `add_messages` reducer on the `messages` field will handle appending.
-        return {"messages": [response]}
 
+def plan_step_retry_node(
+        state: EmailProcessingState,
+        llm_with_tools: Runnable
+) -> Command[Literal["execute_tools", "finish_email"]]:
+    """
+    Retries a planning step whose LLM call failed in plan_step. This node is not cached, so the
+    error recorded when the retry fails too is never replayed for later emails.
+    """
+    logger.debug("---NODE: PLANNING STEP (RETRY)---")
+    try:
+        return _plan(state.get('messages', []), llm_with_tools)
     except Exception as e:
-        logger.error(f"Error during planning step: {e}")
-        # If the LLM fails, append an empty AIMessage. This ensures the
-        # `should_continue` node receives the expected message type and can route to the end.
+        logger.error("Error during planning step: %s", e)
+        # If the LLM fails, record the error as an AIMessage and finish the current email.
         error_message = AIMessage(content=f"LLM failed to respond. Error: {e}")
-        return {"messages": [error_message]}
+        return Command(update={"messages": [error_message]}, goto="finish_email")
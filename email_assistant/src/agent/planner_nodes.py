@@ -1,87 +1,55 @@
+from functools import partial
+from operator import itemgetter
 from langchain_core.messages import BaseMessage
-from email_assistant.src.agent.state import EmailAgentState
+from email_assistant.src.agent.state import EmailProcessingState
+from email_assistant.src.config import config
 from email_assistant.src.logger import logger
 from email_assistant.src.prompts.prompt_manager import prompt_manager
 from datetime import datetime
 
+# Per planner: the label used in logs and whether its prompt needs the current date.
+# The prompt names themselves live in PromptManager.PLANNER_PROMPTS under the same keys.
+_PLANNER_TABLE = {
+    "meeting": ("MEETING", True),
+    "task": ("TASK", False),
+    "invoice": ("INVOICE", False),
+    "general": ("GENERAL", False),
+}
+
+# Reads the fields the planner prompts need in one C-level call; the fetchers always populate all Email keys
+# and have already normalized and clipped the body (see clean_email_body)
+_email_fields = itemgetter('subject', 'sender', 'body')
+# OpenAI and Gemini cache long static prefixes implicitly; Anthropic only caches up to an explicit marker
+_CACHE_SYSTEM_PROMPT = config.model_provider == "anthropic"
+
 # --- Specialist Planner Nodes ---
 
-def meeting_planner(state: EmailAgentState) -> dict[str, list[BaseMessage]]:
+def _run_planner(state: EmailProcessingState, planner: str) -> dict[str, list[BaseMessage]]:
     """
-    Planner node for meeting-related emails.
+    Shared planner node: formats the planner's system and human prompts for the current email.
+    The planner's job is to prepare the initial messages for the reasoning loop.
     """
-    logger.info("---NODE: MEETING PLANNER---")    
-    current_email = state.get('current_email')
-    if not current_email:
-        logger.warning("Meeting planner called without a current email in state.")
-        return {}
-
-    # Use the dedicated method to get the combined chat prompt template
-    chat_prompt_template = prompt_manager.get_meeting_planner_chat_prompt()
-    
-    # Format the template with all required variables to get the list of messages
-    messages = chat_prompt_template.format_messages(
-        current_date=datetime.now().strftime("%Y-%m-%d"),
-        email_subject=current_email.get('subject', ''),
-        sender=current_email.get('sender', ''),
-        email_body=current_email.get('body', '')
-    )
-    # The planner's job is to prepare the initial messages for the reasoning loop.
-    return {"messages": messages}
-
-
-def task_planner(state: EmailAgentState) -> dict:
-    """Planner node for task-related emails."""
-    logger.info("---NODE: TASK PLANNER---")
-    
-    current_email = state.get('current_email')
-    if not current_email:
-        logger.warning("Task planner called without a current email in state.")
-        return {}
-
-    chat_prompt_template = prompt_manager.get_task_planner_chat_prompt()
-    messages = chat_prompt_template.format_messages(
-        email_subject=current_email.get('subject', ''),
-        sender=current_email.get('sender', ''),
-        email_body=current_email.get('body', '')
-    )
-
-    return {"messages": messages}
-
-
-def invoice_planner(state: EmailAgentState) -> dict:
-    """Planner node for invoice-related emails."""
-    logger.info("---NODE: INVOICE PLANNER---")
-    
+    label, needs_date = _PLANNER_TABLE[planner]
+    logger.debug("---NODE: %s PLANNER---", label)
     current_email = state.get('current_email')
     if not current_email:
-        logger.warning("Invoice planner called without a current email in state.")
+        logger.warning("%s planner called without a current email in state.", label.capitalize())
         return {}
 
-    chat_prompt_template = prompt_manager.get_invoice_planner_chat_prompt()
-    messages = chat_prompt_template.format_messages(
-        email_subject=current_email.get('subject', ''),
-        sender=current_email.get('sender', ''),
-        email_body=current_email.get('body', '')
-    )
-
-    return {"messages": messages}
-
-
-def general_planner(state: EmailAgentState) -> dict:
-    """A general-purpose planner for other email types."""
-    logger.info("---NODE: GENERAL PLANNER---")
-    
-    current_email = state.get('current_email')
-    if not current_email:
-        logger.warning("General planner called without a current email in state.")
-        return {}
-
-    chat_prompt_template = prompt_manager.get_general_planner_chat_prompt()
-    messages = chat_prompt_template.format_messages(
-        email_subject=current_email.get('subject', ''),
-        sender=current_email.get('sender', ''),
-        email_body=current_email.get('body', '')
-    )
-
-    return {"messages": messages}
+    subject, sender, body = _email_fields(current_email)
+    variables = {"email_subject": subject, "sender": sender, "email_body": body}
+    if needs_date:
+        # Goes into the human prompt so the system prompt stays a cacheable static prefix.
+        # The date is formatted once per batch by fetch_emails_node
+        variables["current_date"] = state.get('run_date') or datetime.now().strftime("%Y-%m-%d")
+    return {"messages": prompt_manager.build_planner_messages(planner, variables, _CACHE_SYSTEM_PROMPT)}
+
+
+# Planner node for meeting-related emails
+meeting_planner = partial(_run_planner, planner="meeting")
+# Planner node for task-related emails
+task_planner = partial(_run_planner, planner="task")
+# Planner node for invoice-related emails
+invoice_planner = partial(_run_planner, planner="invoice")
+# A general-purpose planner for other email types
+general_planner = partial(_run_planner, planner="general")
@@ -1,13 +1,54 @@
-from typing import TypedDict, List, Annotated, Sequence, Literal, Dict, Any, Optional
+from typing import TypedDict, List, Set, Annotated, Sequence, Literal, Dict, Any, Iterable, Optional
 from langchain_core.messages import BaseMessage
 from langgraph.graph.message import add_messages
 from email_assistant.src.data_models import Email, UserPreferences
-from email_assistant.src.tools.email_fetcher import BaseEmailFetcher
-from email_assistant.src.agent.email_actions import BaseEmailActions
 
 
 
-class EmailAgentState(TypedDict):
+def merge_email_ids(existing: Set[str], new: Iterable[str]) -> Set[str]:
+    """Reducer that unions newly processed email IDs into the run's set, giving O(1) membership checks."""
+    return set(existing or ()).union(new or ())
+
+
+def append_email_ids(existing: List[str], new: Optional[Iterable[str]]) -> List[str]:
+    """Reducer that appends email IDs written by concurrent branches; writing None clears the list."""
+    if new is None:
+        return []
+    return list(existing or ()) + list(new)
+
+
+# State schemas stay TypedDicts: LangGraph hands dict-based state to nodes as-is, whereas a dataclass
+# schema would be re-instantiated from the channel values on every node call.
+class EmailProcessingOutput(TypedDict):
+    """The keys a per-email branch hands back to the batch: both merge safely across concurrent branches."""
+    # IDs of emails successfully processed in this run; nodes return new IDs and the reducer merges them
+    processed_email_ids: Annotated[Set[str], merge_email_ids]
+    # IDs of emails classified as spam, marked in bulk once the batch is finished
+    pending_spam_ids: Annotated[List[str], append_email_ids]
+
+
+class EmailProcessingState(EmailProcessingOutput):
+    """
+    The state of the process_email subgraph, which handles a single email. Each email in a batch
+    gets its own instance via Send, so per-email fields never need to be cleared between emails.
+    """
+    # The email object currently under analysis
+    current_email: Optional[Email]
+    classification: Optional[Literal["priority", "meeting", "task", "invoice", "newsletter", "spam", "other"]]
+    summary: Optional[str]
+    # For invoices, contact info, etc.
+    extracted_data: Optional[Dict[str, Any]]
+
+    # --- Core Reasoning State ---
+    messages: Annotated[Sequence[BaseMessage], add_messages]
+
+    # --- Configuration ---
+    user_preferences: UserPreferences
+    # Date of the batch (YYYY-MM-DD), formatted once per fetch for the planners
+    run_date: Optional[str]
+
+
+class EmailAgentState(EmailProcessingOutput):
     """
     The central state for the email agent. It's passed between nodes in the graph,
     accumulating data as the agent processes emails.
@@ -15,27 +56,16 @@ class EmailAgentState(TypedDict):
     # --- Batch Processing State ---
     # The list of emails fetched for this run
     inbox: List[Email]
-    # The index of the email currently being processed            
-    current_email_index: int            
-    # IDs of emails successfully processed in this run
-    processed_email_ids: List[str]
+    # Number of emails in the inbox, stored once per fetch
+    inbox_size: int
+    # Classification for each inbox email, produced in one batched LLM call (None if unresolved)
+    classifications: List[Optional[str]]
     # number of times fetch_emails_node has been run
     fetch_emails_run_count: Optional[int]  
+    # processed_email_ids and pending_spam_ids are inherited from EmailProcessingOutput
 
-    # --- Per-Email Processing State (cleared for each new email) ---
-    # The email object currently under analysis
-    current_email: Optional[Email] 
-    classification: Optional[Literal["priority", "meeting", "task", "invoice", "newsletter", "spam", "other"]]
-    summary: Optional[str]
-    # For invoices, contact info, etc.
-    extracted_data: Optional[Dict[str, Any]]      
-
-    # --- Core Reasoning State ---
-    messages: Annotated[Sequence[BaseMessage], add_messages]
+    # Date of the current batch (YYYY-MM-DD), formatted once per fetch and passed to every email
+    run_date: Optional[str]
 
     # --- Configuration & Services ---
     user_preferences: UserPreferences
-    # The client for performing email actions (provider-agnostic)
-    email_actions_client: Optional[BaseEmailActions] = None
-    # The email fetcher instance, needed for tool selection
-    email_fetcher: Optional[BaseEmailFetcher] = None
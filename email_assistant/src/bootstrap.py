@@ -0,0 +1,5 @@
+from dotenv import load_dotenv, find_dotenv
+
+# Loads variables from the .env file once per process. Modules that read the environment at import
+# time (logger, config) import this module first, so the upward .env search runs a single time.
+load_dotenv(find_dotenv())
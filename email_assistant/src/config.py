@@ -1,10 +1,7 @@
 import os
-from dotenv import load_dotenv, find_dotenv
+import email_assistant.src.bootstrap  # noqa: F401 - loads .env before the settings below are read
 from email_assistant.src.logger import logger
 
-dotenv_path = find_dotenv()
-load_dotenv(dotenv_path)  # This loads the variables from .env
-
 class Config:
     """A centralized configuration class to load and manage settings from environment variables."""
     def __init__(self):
@@ -15,6 +12,22 @@ class Config:
         self.temperature = float(os.getenv('TEMPERATURE', 0))        
         self.google_api_key = os.getenv('GOOGLE_API_KEY')
         self.max_fetch_cycles = int(os.getenv('MAX_FETCH_CYCLES', 2))
+        # Upper bound on concurrent LLM requests when emails are classified individually
+        self.llm_max_concurrency = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+        # Characters of the cleaned email body sent to the classifier
+        self.classify_body_chars = int(os.getenv('CLASSIFY_BODY_CHARS', 800))
+        # Seconds a cached email classification stays valid (keyed by email content)
+        self.classification_cache_ttl = int(os.getenv('CLASSIFICATION_CACHE_TTL', 86400))
+        # Seconds a cached plan_step decision stays valid (keyed by the full message history)
+        self.plan_step_cache_ttl = int(os.getenv('PLAN_STEP_CACHE_TTL', 3600))
+        # Characters of the email body kept by the fetchers; longer bodies keep their head and tail
+        self.max_body_chars = int(os.getenv('MAX_BODY_CHARS', 8000))
+        # Encrypted local copy of the Outlook token cache (needs msal-extensions), read before Secret Manager
+        self.outlook_token_cache_path = os.path.expanduser(
+            os.getenv('OUTLOOK_TOKEN_CACHE_PATH', '~/.cache/email_assistant/outlook_token_cache.bin')
+        )
+        # Upper bound on emails of a batch processed concurrently by the process_email subgraph
+        self.email_max_concurrency = int(os.getenv('EMAIL_MAX_CONCURRENCY', 4))
         
 
 # Create a singleton instance of the Config class to be used throughout the application.
@@ -1,4 +1,9 @@
-from typing import TypedDict, List, Dict, Any
+from typing import TypedDict, List, Dict, Any, Literal
+from pydantic import BaseModel, Field
+
+
+# The categories an email can be classified into
+EmailCategory = Literal["priority", "meeting", "task", "invoice", "newsletter", "spam", "other"]
 
 
 class Email(TypedDict):
@@ -15,4 +20,9 @@ class UserPreferences(TypedDict):
     priority_senders: List[str]
     auto_archive_rules: Dict[str, Any]
     # e.g., ["send_email", "create_event"]
-    approval_required_for: List[str]
\ No newline at end of file
+    approval_required_for: List[str]
+
+
+class EmailClassification(BaseModel):
+    """Structured classifier output; the Literal constraint rejects labels outside EmailCategory."""
+    label: EmailCategory = Field(description="The single category that best fits the email.")
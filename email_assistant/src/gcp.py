@@ -0,0 +1,53 @@
+import functools
+import os
+import time
+from typing import Optional
+import google.auth
+from google.cloud import secretmanager
+
+# Seconds a secret payload read from Secret Manager is reused before it is read again
+_SECRET_TTL_SECONDS = 300
+# (project ID, secret ID) -> (time.monotonic() deadline, payload of the latest version)
+_secret_cache: dict[tuple[str, str], tuple[float, bytes]] = {}
+
+
+@functools.cache
+def get_secret_manager_client() -> secretmanager.SecretManagerServiceClient:
+    """
+    Returns the process-wide Secret Manager client. Creating a client opens a new gRPC channel, and
+    the client is thread-safe, so every fetcher shares this one.
+    """
+    return secretmanager.SecretManagerServiceClient()
+
+
+@functools.cache
+def get_project_id() -> Optional[str]:
+    """
+    Returns the Google Cloud project ID from Application Default Credentials, falling back to the
+    GOOGLE_CLOUD_PROJECT environment variable. Resolved once, as ADC may query the metadata server.
+    """
+    try:
+        _, project_id = google.auth.default()
+        return project_id
+    except google.auth.exceptions.DefaultCredentialsError:
+        return os.getenv("GOOGLE_CLOUD_PROJECT")
+
+
+def access_secret(project_id: str, secret_id: str) -> bytes:
+    """
+    Returns the payload of a secret's latest version, reusing a read made within the last
+    _SECRET_TTL_SECONDS so repeated connects skip the gRPC round-trip. NotFound is raised, never cached.
+    """
+    key = (project_id, secret_id)
+    cached = _secret_cache.get(key)
+    if cached is not None and time.monotonic() < cached[0]:
+        return cached[1]
+    client = get_secret_manager_client()
+    response = client.access_secret_version(request={"name": client.secret_version_path(project_id, secret_id, "latest")})
+    _secret_cache[key] = (time.monotonic() + _SECRET_TTL_SECONDS, response.payload.data)
+    return response.payload.data
+
+
+def invalidate_secret(project_id: str, secret_id: str):
+    """Drops a cached secret payload, e.g. after a new version was added."""
+    _secret_cache.pop((project_id, secret_id), None)
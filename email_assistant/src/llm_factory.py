@@ -1,13 +1,31 @@
+import functools
 from email_assistant.src.config import config
 from email_assistant.src.logger import logger
 
+# with_structured_output arguments that make each provider constrain decoding to the schema,
+# so fixed-choice replies (e.g. a classification label) cost only a few output tokens and never fail to parse
+_STRUCTURED_OUTPUT_KWARGS = {
+    # Gemini decodes against the response_schema, including Literal enums
+    "google": {"method": "json_mode"},
+    "openai": {"method": "json_schema", "strict": True},
+    # A single schema tool forced via tool_choice
+    "anthropic": {"method": "function_calling"},
+}
+
 class LLMFactory:
     """A factory class for creating instances of langchain chat models."""
 
     @staticmethod
+    def structured_output_kwargs() -> dict:
+        """Returns the with_structured_output arguments for the configured provider."""
+        return dict(_STRUCTURED_OUTPUT_KWARGS.get(config.model_provider, {}))
+
+    @staticmethod
+    @functools.cache
     def get_instance():
         """
         Creates and returns a chat model instance based on the configuration.
+        The instance is created on first call and shared afterwards.
 
         Returns:
             An instance of a langchain chat model.
@@ -42,6 +60,11 @@ class LLMFactory:
         else:
             raise ValueError(f"Unsupported model provider: {provider}")
 
-# Singleton instance of the LLM
-llm = LLMFactory.get_instance()
-logger.info("LLM singleton instance created successfully.")
\ No newline at end of file
+def __getattr__(name: str):
+    """
+    Exposes the LLM singleton as the module attribute `llm`, created on first access (PEP 562)
+    so importing this module does not load a provider SDK until a model is actually needed.
+    """
+    if name == "llm":
+        return LLMFactory.get_instance()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
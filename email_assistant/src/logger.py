@@ -1,9 +1,6 @@
 import logging
 import os
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
+import email_assistant.src.bootstrap  # noqa: F401 - loads .env before LOG_LEVEL is read
 
 # Get log level from environment variable, default to INFO
 log_level_name = os.getenv('LOG_LEVEL', 'INFO').upper()
@@ -16,6 +13,8 @@ log_format = '%(asctime)s-[%(module)s.%(funcName)s:%(lineno)d]-%(levelname)s - %
 
 logger = logging.getLogger("email_assistant")
 logger.setLevel(log_level)
+# Records are handled by the console handler below only, skipping the walk up to the root logger
+logger.propagate = False
 
 if not logger.handlers:
     console_handler = logging.StreamHandler()
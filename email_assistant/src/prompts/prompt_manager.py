@@ -1,13 +1,66 @@
 import yaml
-from langchain.prompts import PromptTemplate
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from pathlib import Path
+from typing import Callable
+import keyword
 import os
+import re
+import string
+import textwrap
+
+# libyaml's C loader parses an order of magnitude faster than the pure-Python one; fall back when PyYAML lacks it
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # pragma: no cover - depends on how PyYAML was built
+    from yaml import SafeLoader as _YamlLoader
+
+# Whitespace that costs prompt tokens without carrying meaning: trailing spaces and runs of blank lines
+_TRAILING_WHITESPACE_RE = re.compile(r"[ \t]+\n")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def _normalize_prompt(prompt: str) -> str:
+    """Dedents a prompt and collapses redundant whitespace, once at load time."""
+    prompt = textwrap.dedent(prompt).strip()
+    prompt = _TRAILING_WHITESPACE_RE.sub("\n", prompt)
+    return _BLANK_LINES_RE.sub("\n\n", prompt)
+
+
+def _compile_template(template: str) -> Callable[..., str]:
+    """
+    Compiles a str.format template into a function that renders it as an f-string, so placeholders
+    are parsed once at load time instead of on every format_map call. Templates using positional
+    fields, attribute access, conversions or format specs fall back to format_map.
+    """
+    try:
+        fields = [(field, spec, conversion) for _, field, spec, conversion in string.Formatter().parse(template)
+                  if field is not None]
+    except ValueError:
+        fields = None
+    if fields is None or any(spec or conversion or not field.isidentifier() or keyword.iskeyword(field)
+                             for field, spec, conversion in fields):
+        return lambda **variables: template.format_map(variables)
+
+    # Unused variables are accepted and ignored, matching format_map
+    params = "".join(f"{name}, " for name in dict.fromkeys(field for field, _, _ in fields))
+    namespace = {}
+    exec(f"def _render({'*, ' if params else ''}{params}**_extra): return f{template!r}", namespace)
+    return namespace["_render"]
+
 
 class PromptManager:
     """
     Manages loading and providing prompts from a YAML file.
     """
+    # System and human prompt names for each planner node
+    PLANNER_PROMPTS = {
+        "meeting": ("CALENDAR_EVENT_SYSTEM_PROMPT", "CALENDAR_EVENT_HUMAN_PROMPT"),
+        "task": ("TASK_PLANNER_SYSTEM_PROMPT", "TASK_PLANNER_HUMAN_PROMPT"),
+        "invoice": ("INVOICE_PLANNER_SYSTEM_PROMPT", "INVOICE_PLANNER_HUMAN_PROMPT"),
+        "general": ("GENERAL_PLANNER_SYSTEM_PROMPT", "GENERAL_PLANNER_HUMAN_PROMPT"),
+    }
+
     def __init__(self, prompt_filepath: str):
         """
         Initializes the PromptManager by loading prompts from the specified file.
@@ -16,17 +69,34 @@ class PromptManager:
             raise FileNotFoundError(f"Prompt file not found at: {prompt_filepath}")
         
         self._prompts = self._load_prompts_from_file(prompt_filepath)
+        # Every string template compiled once into a render function, see _compile_template
+        self._renderers = {
+            name: _compile_template(prompt) for name, prompt in self._prompts.items() if isinstance(prompt, str)
+        }
+        # (system template, system renderer, human renderer) per planner, resolved once so building messages is two calls
+        self._compiled_planner_prompts = {
+            planner: (self._prompts[system_name], self._renderers[system_name], self._renderers[human_name])
+            for planner, (system_name, human_name) in self.PLANNER_PROMPTS.items()
+            if system_name in self._renderers and human_name in self._renderers
+        }
+        # ChatPromptTemplates built by the get_*_chat_prompt methods, keyed by prompt pair
+        self._chat_prompts: dict[str, ChatPromptTemplate] = {}
+        # Planner system messages without placeholders, built once and shared by every email of every batch
+        self._static_system_messages: dict[tuple[str, bool], SystemMessage] = {}
 
 
     def _load_prompts_from_file(self, file_path: str) -> dict[str, str]:
-        """Loads prompts from a YAML file and converts them to PromptTemplate objects."""
+        """Loads prompts from a YAML file as raw template strings."""
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                prompts = yaml.safe_load(f)
+                prompts = yaml.load(f, Loader=_YamlLoader)
             if not isinstance(prompts, dict):
                 print(f"Warning: Prompts file '{file_path}' did not load as a dictionary.")
                 return {} 
-            return prompts
+            return {
+                name: _normalize_prompt(prompt) if isinstance(prompt, str) else prompt
+                for name, prompt in prompts.items()
+            }
         except FileNotFoundError:
             print(f"Error: Prompts file not found at '{file_path}'")
             return {} 
@@ -47,52 +117,86 @@ class PromptManager:
         return self._prompts[prompt_name]
 
 
-    def get_meeting_planner_chat_prompt(self) -> list:
+    def format(self, prompt_name: str, **variables) -> str:
+        """
+        Renders a prompt template with its compiled render function, for callers that only need the text.
+        """
+        renderer = self._renderers.get(prompt_name)
+        if renderer is None:
+            raise KeyError(f"Prompt '{prompt_name}' not found in the prompt manager.")
+        return renderer(**variables)
+
+
+    def build_planner_messages(
+            self,
+            planner: str,
+            variables: dict,
+            cache_system_prompt: bool = False
+    ) -> list[BaseMessage]:
         """
-        Returns the chat prompt template for the meeting planner.
+        Renders a planner's system and human templates straight into messages, bypassing
+        ChatPromptTemplate's per-call template parsing. Planner system prompts are static, so with
+        cache_system_prompt the system message carries an explicit prompt-cache breakpoint.
         """
-        system_prompt_template = self.get_prompt("CALENDAR_EVENT_SYSTEM_PROMPT")
-        human_prompt_template = self.get_prompt("CALENDAR_EVENT_HUMAN_PROMPT")
-        return ChatPromptTemplate.from_messages([
-            ("system", system_prompt_template),
-            ("human", human_prompt_template)
-        ])
+        if planner not in self._compiled_planner_prompts:
+            raise KeyError(f"Prompts for planner '{planner}' not found in the prompt manager.")
+        system_template, render_system, render_human = self._compiled_planner_prompts[planner]
+        # A list, not a tuple: add_messages wraps any non-list update as a single message
+        return [
+            self._planner_system_message(planner, system_template, render_system, variables, cache_system_prompt),
+            # Built per call: validation costs a few microseconds, less than hashing the rendered email for a cache
+            HumanMessage(content=render_human(**variables))
+        ]
 
 
-    def get_task_planner_chat_prompt(self) -> list:
+    def _planner_system_message(
+            self,
+            planner: str,
+            system_template: str,
+            render_system: Callable[..., str],
+            variables: dict,
+            cache_system_prompt: bool
+    ) -> SystemMessage:
         """
-        Returns the chat prompt template for the task planner.
+        Returns the planner's system message. Static system prompts are turned into a single shared
+        SystemMessage with a fixed ID, so a batch references one preamble instead of copying it per email.
         """
-        system_prompt_template = self.get_prompt("TASK_PLANNER_SYSTEM_PROMPT")
-        human_prompt_template = self.get_prompt("TASK_PLANNER_HUMAN_PROMPT")
-        return ChatPromptTemplate.from_messages([
-            ("system", system_prompt_template),
-            ("human", human_prompt_template)
-        ])
+        key = (planner, cache_system_prompt)
+        message = self._static_system_messages.get(key)
+        if message is not None:
+            return message
+
+        is_static = all(field is None for _, field, _, _ in string.Formatter().parse(system_template))
+        system_content = render_system(**variables)
+        if cache_system_prompt:
+            system_content = [{"type": "text", "text": system_content, "cache_control": {"type": "ephemeral"}}]
+        if not is_static:
+            return SystemMessage(content=system_content)
+        message = SystemMessage(content=system_content, id=f"{planner}-planner-system")
+        self._static_system_messages[key] = message
+        return message
 
 
-    def get_invoice_planner_chat_prompt(self) -> list:
+    def _get_chat_prompt(self, key: str, system_name: str, human_name: str) -> ChatPromptTemplate:
         """
-        Returns the chat prompt template for the invoice planner.
+        Returns the chat prompt template built from a system and human prompt. Templates are
+        built on first use and then reused, so callers never re-parse the same prompts.
         """
-        system_prompt_template = self.get_prompt("INVOICE_PLANNER_SYSTEM_PROMPT")
-        human_prompt_template = self.get_prompt("INVOICE_PLANNER_HUMAN_PROMPT")
-        return ChatPromptTemplate.from_messages([
-            ("system", system_prompt_template),
-            ("human", human_prompt_template)
-        ])
+        chat_prompt = self._chat_prompts.get(key)
+        if chat_prompt is None:
+            chat_prompt = ChatPromptTemplate.from_messages([
+                ("system", self.get_prompt(system_name)),
+                ("human", self.get_prompt(human_name))
+            ])
+            self._chat_prompts[key] = chat_prompt
+        return chat_prompt
 
 
-    def get_general_planner_chat_prompt(self) -> list:
+    def get_classify_email_chat_prompt(self) -> ChatPromptTemplate:
         """
-        Returns the chat prompt template for the general planner.
+        Returns the chat prompt template for single-email classification.
         """
-        system_prompt_template = self.get_prompt("GENERAL_PLANNER_SYSTEM_PROMPT")
-        human_prompt_template = self.get_prompt("GENERAL_PLANNER_HUMAN_PROMPT")
-        return ChatPromptTemplate.from_messages([
-            ("system", system_prompt_template),
-            ("human", human_prompt_template)
-        ])
+        return self._get_chat_prompt("classify_email", "CLASSIFY_EMAIL_SYSTEM_PROMPT", "CLASSIFY_EMAIL_HUMAN_PROMPT")
 
 # Define the path to the prompts file relative to the current file's location.
 PROMPTS_FILE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "prompts.yaml"))
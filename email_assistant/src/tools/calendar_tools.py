@@ -1,11 +1,46 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 from typing import List, Dict, Any
-from datetime import datetime
+import re
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from langchain_core.tools import tool
 from email_assistant.src.logger import logger
+from email_assistant.src.serialization import JSON_HEADERS, json_dumps, json_loads
 from email_assistant.src.tools.outlook_fetcher import OutlookFetcher
 
+# ISO 8601 date-time as the tools expect it, e.g. 2024-08-01T10:00:00Z; seconds and the UTC offset are optional.
+# re.ASCII keeps \d to 0-9; whether the day exists in its month is checked by _is_iso_datetime
+_ISO_DATETIME_RE = re.compile(
+    r"\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12]\d|3[01])T(?:[01]\d|2[0-3]):[0-5]\d(?::[0-5]\d(?:\.\d+)?)?"
+    r"(?:Z|[+-](?:[01]\d|2[0-3]):[0-5]\d)?",
+    re.ASCII
+)
+# Values shared by every payload; Graph interprets all tool times in UTC and invites attendees as required
+_TIME_ZONE = "UTC"
+_ATTENDEE_TYPE = "required"
+
+
+def _is_iso_datetime(value: str) -> bool:
+    """Checks a tool time against _ISO_DATETIME_RE, rejecting dates that do not exist such as 2024-02-31."""
+    if not _ISO_DATETIME_RE.fullmatch(value):
+        return False
+    try:
+        date.fromisoformat(value[:10])
+    except ValueError:
+        return False
+    return True
+
+
+def _utc_time(value: str) -> Dict[str, str]:
+    """Builds a Graph dateTimeTimeZone object for a UTC time."""
+    return {"dateTime": value, "timeZone": _TIME_ZONE}
+
+
 class BaseCalendarTool(ABC):
     """Abstract base class for calendar tools."""
 
@@ -73,38 +108,96 @@ class BaseCalendarTool(ABC):
 
 class OutlookCalendarTool(BaseCalendarTool):
     """Concrete implementation of calendar tools for Microsoft Outlook."""
-    
+    # (connect, read) timeouts in seconds for Graph calls
+    REQUEST_TIMEOUT = (3.05, 30)
+    # Microsoft Graph JSON batching accepts at most 20 sub-requests per call
+    BATCH_MAX_REQUESTS = 20
+    # $batch calls kept in flight at once when the operations span several batches
+    BATCH_MAX_CONCURRENCY = 4
+    # getSchedule accepts at most 20 schedules per request
+    SCHEDULE_MAX_ATTENDEES = 20
+    # Seconds before expiry at which the cached access token is refreshed
+    TOKEN_REFRESH_MARGIN = 300
+
     def __init__(self, fetcher: OutlookFetcher):
         self.fetcher = fetcher
         self.base_url = "https://graph.microsoft.com/v1.0"
+        self.session = self._build_session()
+        # Access token reused across calls until shortly before it expires (time.monotonic() deadline)
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
 
 
-    def _get_access_token(self) -> str:
-        """Acquires an access token silently using the fetcher's authenticated state."""
+    def _build_session(self) -> requests.Session:
+        """
+        Builds the session shared by all calendar calls, so consecutive tool calls reuse a warm
+        keep-alive connection to Graph instead of paying a TCP and TLS handshake each. The bearer
+        token lives in the session headers and is only replaced when the token is refreshed.
+        Only GET and PATCH are retried: a retried POST could create the same event twice.
+        """
+        retry = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET", "PATCH"]
+        )
+        session = requests.Session()
+        session.headers.update(JSON_HEADERS)
+        session.mount(self.base_url, HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry))
+        return session
+
+
+    def close(self):
+        """Closes the pooled connections of the calendar session."""
+        self.session.close()
+
+
+    def _get_access_token(self, force_refresh: bool = False) -> str:
+        """
+        Returns the cached access token, acquiring a new one silently using the fetcher's authenticated
+        state once it is within TOKEN_REFRESH_MARGIN of expiry, so most calls skip MSAL's token cache scan.
+        A new token is also set as the session's Authorization header.
+        """
+        if not force_refresh and time.monotonic() < self._token_expires_at:
+            return self._token
         if not self.fetcher.app or not self.fetcher.account:
             raise Exception("Outlook fetcher is not connected. Cannot get access token.")
-        
-        result = self.fetcher.app.acquire_token_silent(
-            scopes=self.fetcher.SCOPES,
-            account=self.fetcher.account
-        )
-        if not result or "access_token" not in result:
-            logger.error("Could not acquire access token silently for calendar tool.")
-            # Attempting a refresh with the device flow is complex here.
-            # The initial connection via the fetcher should handle it.
-            raise Exception("Authentication failed. Could not get access token for calendar tool.")
-        return result["access_token"]
+
+        with self._token_lock:
+            # Another thread may have refreshed the token while this one waited for the lock
+            if not force_refresh and time.monotonic() < self._token_expires_at:
+                return self._token
+            result = self.fetcher.app.acquire_token_silent(
+                scopes=self.fetcher.SCOPES,
+                account=self.fetcher.account,
+                force_refresh=force_refresh
+            )
+            if not result or "access_token" not in result:
+                logger.error("Could not acquire access token silently for calendar tool.")
+                # Attempting a refresh with the device flow is complex here.
+                # The initial connection via the fetcher should handle it.
+                raise Exception("Authentication failed. Could not get access token for calendar tool.")
+            self._token = result["access_token"]
+            self.session.headers["Authorization"] = "Bearer " + self._token
+            self._token_expires_at = time.monotonic() + int(result.get("expires_in", 0)) - self.TOKEN_REFRESH_MARGIN
+            return self._token
 
 
     def _make_api_call(self, method: str, endpoint: str, json_data: Dict = None) -> Dict[str, Any]:
         """Helper function to make API calls to Microsoft Graph."""
         try:
-            access_token = self._get_access_token()
-            headers = {'Authorization': 'Bearer ' + access_token, 'Content-Type': 'application/json'}
             url = f"{self.base_url}{endpoint}"
-            response = requests.request(method, url, headers=headers, json=json_data)
+            data = json_dumps(json_data) if json_data is not None else None
+            self._get_access_token()
+            response = self.session.request(method, url, data=data, timeout=self.REQUEST_TIMEOUT)
+            if response.status_code == 401:
+                # The cached token was rejected (e.g. revoked before expiry): refresh it and retry once
+                logger.warning("Access token rejected for %s, refreshing and retrying once.", endpoint)
+                self._get_access_token(force_refresh=True)
+                response = self.session.request(method, url, data=data, timeout=self.REQUEST_TIMEOUT)
             response.raise_for_status() # Raises an HTTPError for bad responses (4xx or 5xx)
-            return response.json() if response.content else {}
+            return json_loads(response.content) if response.content else {}
         except requests.exceptions.HTTPError as e:
             logger.error(f"HTTP Error during API call to {endpoint}: {e.response.text}")
             raise
@@ -113,6 +206,98 @@ class OutlookCalendarTool(BaseCalendarTool):
             raise
 
 
+    def _send(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Sends a single request built by one of the _build_*_request helpers."""
+        return self._make_api_call(request["method"], request["url"], json_data=request.get("body"))
+
+
+    def batch(self, requests_to_send: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Sends several requests built by the _build_*_request helpers through Graph JSON batching,
+        so every 20 operations cost a single round-trip to the $batch endpoint. More than one batch
+        sends up to BATCH_MAX_CONCURRENCY $batch requests in parallel. Returns one
+        {"status": <HTTP status>, "body": <response body>} per request, in the order given.
+        """
+        chunks = [
+            requests_to_send[start:start + self.BATCH_MAX_REQUESTS]
+            for start in range(0, len(requests_to_send), self.BATCH_MAX_REQUESTS)
+        ]
+        if len(chunks) <= 1:
+            return [result for chunk in chunks for result in self._send_batch(chunk)]
+
+        # The calls are network-bound, so several $batch requests share the pooled session concurrently
+        with ThreadPoolExecutor(max_workers=min(self.BATCH_MAX_CONCURRENCY, len(chunks))) as executor:
+            chunk_results = executor.map(self._send_batch, chunks)
+            return [result for results in chunk_results for result in results]
+
+
+    def _send_batch(self, requests_to_send: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Sends one $batch request of up to 20 sub-requests and maps each sub-response back to its slot."""
+        batch_payload = {"requests": []}
+        for i, request in enumerate(requests_to_send):
+            sub_request = {"id": str(i), "method": request["method"], "url": request["url"]}
+            if request.get("body") is not None:
+                sub_request["body"] = request["body"]
+                sub_request["headers"] = {"Content-Type": "application/json"}
+            batch_payload["requests"].append(sub_request)
+
+        response_data = self._make_api_call("POST", "/$batch", json_data=batch_payload)
+        sub_responses = {item.get("id"): item for item in response_data.get("responses", [])}
+        results = []
+        for i in range(len(requests_to_send)):
+            sub_response = sub_responses.get(str(i))
+            if sub_response is None:
+                results.append({"status": None, "body": {"error": {"message": "No response returned for batched request."}}})
+            else:
+                results.append({"status": sub_response.get("status"), "body": sub_response.get("body") or {}})
+        return results
+
+
+    def _build_check_availability_request(self, attendees: List[str], start_time: str, end_time: str) -> Dict[str, Any]:
+        """Builds the getSchedule request behind check_availability."""
+        schedules = [{"email": attendee, "availabilityViewInterval": "15"} for attendee in attendees]
+        payload = {
+            "schedules": schedules,
+            "startTime": _utc_time(start_time),
+            "endTime": _utc_time(end_time),
+            "availabilityViewInterval": 15
+        }
+        return {"method": "POST", "url": "/me/calendar/getSchedule", "body": payload}
+
+
+    def _build_create_event_request(
+        self,
+        subject: str,
+        attendees: List[str],
+        start_time: str,
+        end_time: str,
+        body: str = None
+    ) -> Dict[str, Any]:
+        """Validates the event times and builds the request behind create_event."""
+        # --- Pre-execution Validation ---
+        # Validate the date strings before making the API call.
+        # This provides an immediate feedback loop to the LLM if it hallucinates.
+        for name, value in (("start_time", start_time), ("end_time", end_time)):
+            if not _is_iso_datetime(value):
+                error_message = f"Invalid date format for {name}: '{value}'. Dates must be in ISO 8601 format, e.g. '2024-08-01T10:00:00Z'."
+                logger.error(error_message)
+                raise ValueError(error_message)
+
+        event = {
+            "subject": subject,
+            "body": {"contentType": "HTML", "content": body or ""},
+            "start": _utc_time(start_time),
+            "end": _utc_time(end_time),
+            "attendees": [{"emailAddress": {"address": attendee}, "type": _ATTENDEE_TYPE} for attendee in attendees]
+        }
+        return {"method": "POST", "url": "/me/events", "body": event}
+
+
+    def _build_update_event_request(self, event_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+        """Builds the request behind update_event."""
+        return {"method": "PATCH", "url": f"/me/events/{event_id}", "body": updates}
+
+
     def check_availability(
         self, 
         attendees: List[str], 
@@ -120,16 +305,22 @@ class OutlookCalendarTool(BaseCalendarTool):
         end_time: str
     ) -> List[Dict[str, Any]]:
         logger.info(f"Checking availability for {attendees} from {start_time} to {end_time}")
-        endpoint = "/me/calendar/getSchedule"
-        schedules = [{"email": attendee, "availabilityViewInterval": "15"} for attendee in attendees]
-        payload = {
-            "schedules": schedules,
-            "startTime": {"dateTime": start_time, "timeZone": "UTC"},
-            "endTime": {"dateTime": end_time, "timeZone": "UTC"},
-            "availabilityViewInterval": 15
-        }
-        response_data = self._make_api_call("POST", endpoint, json_data=payload)
-        return response_data.get('value', [])
+        if len(attendees) <= self.SCHEDULE_MAX_ATTENDEES:
+            response_data = self._send(self._build_check_availability_request(attendees, start_time, end_time))
+            return response_data.get('value', [])
+
+        # Larger lists are split into getSchedule calls of 20 attendees, sent together through $batch
+        requests_to_send = [
+            self._build_check_availability_request(attendees[start:start + self.SCHEDULE_MAX_ATTENDEES], start_time, end_time)
+            for start in range(0, len(attendees), self.SCHEDULE_MAX_ATTENDEES)
+        ]
+        schedules = []
+        for result in self.batch(requests_to_send):
+            if not result["status"] or not 200 <= result["status"] < 300:
+                error = result["body"].get("error", {}).get("message") or f"HTTP {result['status']}"
+                raise Exception(f"Availability check failed: {error}")
+            schedules.extend(result["body"].get('value', []))
+        return schedules
 
 
     def create_event(
@@ -141,27 +332,17 @@ class OutlookCalendarTool(BaseCalendarTool):
         body: str = None
     ) -> Dict[str, Any]:
         logger.info(f"Creating event '{subject}' from {start_time} to {end_time}")
+        return self._send(self._build_create_event_request(subject, attendees, start_time, end_time, body))
 
-        # --- Pre-execution Validation ---
-        # Validate the date strings before making the API call.
-        # This provides an immediate feedback loop to the LLM if it hallucinates.
-        try:
-            datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-            datetime.fromisoformat(end_time.replace('Z', '+00:00'))
-        except ValueError as e:
-            error_message = f"Invalid date format for start_time or end_time. Dates must be in ISO 8601 format. Error: {e}"
-            logger.error(error_message)
-            raise ValueError(error_message)
-
-        endpoint = "/me/events"
-        event = {
-            "subject": subject,
-            "body": {"contentType": "HTML", "content": body or ""},
-            "start": {"dateTime": start_time, "timeZone": "UTC"},
-            "end": {"dateTime": end_time, "timeZone": "UTC"},
-            "attendees": [{"emailAddress": {"address": attendee}, "type": "required"} for attendee in attendees]
-        }
-        return self._make_api_call("POST", endpoint, json_data=event)
+
+    def bulk_create_events(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Creates several events through Graph JSON batching instead of one request per event. Each item
+        holds the create_event arguments (subject, attendees, start_time, end_time and optionally body).
+        All events are validated before anything is sent. Returns one {"status", "body"} per event, in order.
+        """
+        logger.info("Creating %d events through $batch", len(events))
+        return self.batch([self._build_create_event_request(**event) for event in events])
 
 
     def update_event(
@@ -170,5 +351,4 @@ class OutlookCalendarTool(BaseCalendarTool):
         updates: Dict[str, Any]
     ) -> Dict[str, Any]:
         logger.info(f"Updating event {event_id} with updates: {updates}")
-        endpoint = f"/me/events/{event_id}"
-        return self._make_api_call("PATCH", endpoint, json_data=updates)
+        return self._send(self._build_update_event_request(event_id, updates))
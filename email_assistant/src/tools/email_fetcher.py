@@ -1,19 +1,94 @@
 import base64
-import json
-import os
 import re
+import sys
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
-import google.auth
+from typing import Collection, List, Dict, Any, Optional
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from google.cloud import secretmanager
 from google.api_core import exceptions as google_exceptions
+from email_assistant.src.config import config
 from email_assistant.src.data_models import Email
+from email_assistant.src.gcp import access_secret, get_project_id, get_secret_manager_client, invalidate_secret
 from email_assistant.src.logger import logger
+from email_assistant.src.serialization import json_loads
+
+try:
+    import pybase64 as _base64
+except ImportError:  # pragma: no cover - pybase64 is an optional SIMD speed-up
+    _base64 = base64
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:  # pragma: no cover - selectolax is an optional speed-up
+    HTMLParser = None
+
+# Whitespace that costs prompt tokens without carrying meaning: trailing spaces and runs of blank lines
+_TRAILING_WHITESPACE_RE = re.compile(r"[ \t]+$", re.M)
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+# Marks where the middle of an over-long email body was cut out
+_TRUNCATION_MARKER = "\n...[truncated]...\n"
+# The address inside a "Display Name <address>" sender header
+_SENDER_ADDRESS_RE = re.compile(r'<(.+?)>')
+# Fallback tag stripper used when selectolax is not installed
+_HTML_TAG_RE = re.compile(r'<[^<]+?>')
+
+
+def html_to_text(html: str) -> str:
+    """Extracts the text of an HTML body, with selectolax's C tokenizer when it is installed."""
+    if '<' not in html:
+        return html
+    if HTMLParser is not None:
+        return HTMLParser(html).text(separator=' ')
+    return _HTML_TAG_RE.sub('', html)
+
+
+def _decode_body_data(data: str) -> str:
+    """
+    Decodes a Gmail base64url body part. Missing padding is restored, and bytes that are not valid
+    UTF-8 are replaced instead of failing the whole email.
+    """
+    return _base64.urlsafe_b64decode(data + "=" * (-len(data) % 4)).decode("utf-8", errors="replace")
+
+
+def _extract_gmail_body(payload: Dict[str, Any]) -> str:
+    """
+    Returns the text of a Gmail message payload in one depth-first pass over its MIME tree, where
+    multipart/* parts nest further parts: the first text/plain part wins, otherwise the first
+    text/html part is converted to text. A single-part payload's own body is used as is.
+    """
+    html_data = None
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        data = part.get("body", {}).get("data")
+        if data:
+            mime_type = part.get("mimeType")
+            if mime_type == "text/html":
+                html_data = html_data or data
+            elif mime_type == "text/plain" or part is payload:
+                return _decode_body_data(data)
+        # Reversed so parts are visited in document order
+        stack.extend(reversed(part.get("parts", ())))
+    return html_to_text(_decode_body_data(html_data)) if html_data else ""
+
+
+def clean_email_body(body: str) -> str:
+    """
+    Normalizes an email body once at fetch time, so every downstream node reads the same prepared text.
+    Line endings and redundant whitespace are collapsed, and bodies over config.max_body_chars keep the
+    first three quarters and the last quarter of the budget so both the opening request and any closing
+    details survive.
+    """
+    body = _TRAILING_WHITESPACE_RE.sub("", body.replace("\r\n", "\n"))
+    body = _BLANK_LINES_RE.sub("\n\n", body).strip()
+    if len(body) <= config.max_body_chars:
+        return body
+    tail_chars = config.max_body_chars // 4
+    return body[:config.max_body_chars - tail_chars] + _TRUNCATION_MARKER + body[-tail_chars:]
+
 
 # --- Abstract Base Class ---
 
@@ -28,8 +103,13 @@ class BaseEmailFetcher(ABC):
         pass
 
     @abstractmethod
-    def fetch_raw_unread_emails(self, service: Any, max_count: int) -> List[Dict[str, Any]]:
-        """Fetch a list of raw, unread email messages."""
+    def fetch_raw_unread_emails(
+            self,
+            service: Any,
+            max_count: int,
+            exclude_ids: Collection[str] = ()
+    ) -> List[Dict[str, Any]]:
+        """Fetch a list of raw, unread email messages, skipping (without downloading) those in exclude_ids."""
         pass
 
     @abstractmethod
@@ -37,14 +117,17 @@ class BaseEmailFetcher(ABC):
         """Parse a raw email message into a structured EmailObject."""
         pass
 
-    def get_emails(self, max_count: int = 10) -> List[Email]:
-        """High-level method to connect, fetch, and parse emails."""
+    def get_emails(self, max_count: int = 10, exclude_ids: Collection[str] = ()) -> List[Email]:
+        """
+        High-level method to connect, fetch, and parse emails. Emails in exclude_ids (e.g. those
+        already processed this run but still unread) are not downloaded again.
+        """
         logger.info(f"Starting email fetch process for max {max_count} emails.")
         self.service = self.connect()
         if not self.service:
             logger.error("Failed to connect to the email service.")
             return []
-        raw_emails = self.fetch_raw_unread_emails(self.service, max_count)
+        raw_emails = self.fetch_raw_unread_emails(self.service, max_count, exclude_ids)
         parsed_emails = [self.parse_email(email) for email in raw_emails if email]
         # Filter out any None results from parsing failures
         valid_emails = [email for email in parsed_emails if email]
@@ -61,33 +144,37 @@ class GmailFetcher(BaseEmailFetcher):
     SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
     CREDENTIALS_SECRET_ID = "gmail-credentials"
     TOKEN_SECRET_ID = "gmail-token"
+    # Gmail accepts up to 100 calls per batch HTTP request
+    BATCH_HTTP_MAX_REQUESTS = 100
+
+    def __init__(self):
+        super().__init__()
+        # Credentials behind self.service, kept so later connects can reuse the client while its token is valid
+        self._creds: Optional[Credentials] = None
 
 
     def connect(self) -> Optional[Any]:
         """
-        Connects to the Gmail API using credentials stored in Google Secret Manager.
+        Connects to the Gmail API using credentials stored in Google Secret Manager. The service built
+        by the previous connect is returned as is while its token is valid, so every fetch cycle reuses
+        its open connection instead of rebuilding the client and redoing the TLS handshake.
         """
+        if self.service is not None and self._creds is not None and self._creds.valid:
+            return self.service
+
         creds = None
         try:
-            # Initialize Secret Manager client
-            sm_client = secretmanager.SecretManagerServiceClient()
-            
-            # Get Project ID from environment or ADC
-            try:
-                _, project_id = google.auth.default()
-            except google.auth.exceptions.DefaultCredentialsError:
-                project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
+            # Shared Secret Manager client and Project ID (from ADC or the environment)
+            sm_client = get_secret_manager_client()
+            project_id = get_project_id()
 
             if not project_id:
                 logger.error("Google Cloud Project ID not found. Please set the GOOGLE_CLOUD_PROJECT environment variable or run 'gcloud auth application-default login'.")
                 return None
 
-            token_secret_path = sm_client.secret_version_path(project_id, self.TOKEN_SECRET_ID, "latest")
-            
             # Try to load token from Secret Manager
             try:
-                response = sm_client.access_secret_version(request={"name": token_secret_path})
-                token_data = json.loads(response.payload.data.decode("UTF-8"))
+                token_data = json_loads(access_secret(project_id, self.TOKEN_SECRET_ID))
                 creds = Credentials.from_authorized_user_info(token_data, self.SCOPES)
             except google_exceptions.NotFound:
                 logger.info(f"Secret '{self.TOKEN_SECRET_ID}' not found. Will proceed with new authorization flow.")
@@ -109,9 +196,7 @@ class GmailFetcher(BaseEmailFetcher):
             else:
                 # Fetch credentials from Secret Manager to start the flow
                 try:
-                    creds_secret_path = sm_client.secret_version_path(project_id, self.CREDENTIALS_SECRET_ID, "latest")
-                    response = sm_client.access_secret_version(request={"name": creds_secret_path})
-                    creds_data = json.loads(response.payload.data.decode("UTF-8"))
+                    creds_data = json_loads(access_secret(project_id, self.CREDENTIALS_SECRET_ID))
                     
                     flow = InstalledAppFlow.from_client_config(creds_data, self.SCOPES)
                     creds = flow.run_local_server(port=0)
@@ -127,12 +212,14 @@ class GmailFetcher(BaseEmailFetcher):
                 token_payload = creds.to_json().encode("UTF-8")
                 token_parent = sm_client.secret_path(project_id, self.TOKEN_SECRET_ID)
                 sm_client.add_secret_version(request={"parent": token_parent, "payload": {"data": token_payload}})
+                invalidate_secret(project_id, self.TOKEN_SECRET_ID)
                 logger.info(f"Successfully saved new token to Secret Manager '{self.TOKEN_SECRET_ID}'.")
             except Exception as e:
                 logger.error(f"Failed to save token to Secret Manager: {e}")
 
         try:
             service = build("gmail", "v1", credentials=creds)
+            self._creds = creds
             logger.info("Successfully connected to Gmail API.")
             return service
         except HttpError as error:
@@ -140,19 +227,42 @@ class GmailFetcher(BaseEmailFetcher):
             return None
 
 
-    def fetch_raw_unread_emails(self, service: Any, max_count: int = 10) -> List[Dict[str, Any]]:
+    def fetch_raw_unread_emails(
+            self,
+            service: Any,
+            max_count: int = 10,
+            exclude_ids: Collection[str] = ()
+    ) -> List[Dict[str, Any]]:
+        """
+        Lists unread inbox message IDs, then fetches the ones not in exclude_ids through batch HTTP
+        requests (up to 100 gets each) instead of one round-trip per message. Messages whose get fails are skipped.
+        """
         try:
-            results = service.users().messages().list(userId="me", labelIds=["INBOX"], q="is:unread", maxResults=max_count).execute()
-            messages = results.get("messages", [])
-            
-            email_details = []
+            # Over-fetch the ID listing by the excluded count so up to max_count new messages remain
+            results = service.users().messages().list(
+                userId="me", labelIds=["INBOX"], q="is:unread", maxResults=max_count + len(exclude_ids)
+            ).execute()
+            messages = [message for message in results.get("messages", []) if message["id"] not in exclude_ids]
             if not messages:
                 logger.info("No unread messages found.")
-            else:
-                for message in messages:
-                    msg = service.users().messages().get(userId="me", id=message["id"]).execute()
-                    email_details.append(msg)
-            return email_details
+                return []
+
+            fetched: Dict[str, Dict[str, Any]] = {}
+
+            def _on_response(request_id: str, response: Any, exception: Exception) -> None:
+                if exception is not None:
+                    logger.error("An error occurred fetching email %s: %s", request_id, exception)
+                else:
+                    fetched[request_id] = response
+
+            message_ids = list(dict.fromkeys(message["id"] for message in messages))[:max_count]
+            for start in range(0, len(message_ids), self.BATCH_HTTP_MAX_REQUESTS):
+                batch = service.new_batch_http_request(callback=_on_response)
+                for message_id in message_ids[start:start + self.BATCH_HTTP_MAX_REQUESTS]:
+                    batch.add(service.users().messages().get(userId="me", id=message_id), request_id=message_id)
+                batch.execute()
+            # Keep the order of the list call, which returns the newest messages first
+            return [fetched[message_id] for message_id in message_ids if message_id in fetched]
         except HttpError as error:
             logger.error(f"An error occurred fetching emails: {error}")
             return []
@@ -161,34 +271,27 @@ class GmailFetcher(BaseEmailFetcher):
     def parse_email(self, raw_email: Dict[str, Any]) -> Optional[Email]:
         """Parses the complex Gmail API message object."""
         try:
-            headers = raw_email["payload"]["headers"]
+            payload = raw_email["payload"]
+            # One pass over the headers; built in reverse so the first occurrence of a header wins
+            headers = {header["name"].lower(): header["value"] for header in reversed(payload["headers"])}
             email_id = raw_email["id"]
-            subject = next((i["value"] for i in headers if i["name"] == "Subject"), "")
-            sender = next((i["value"] for i in headers if i["name"] == "From"), "")
-            received_at = next((i["value"] for i in headers if i["name"] == "Date"), "")
-
-            body = ""
-            if "parts" in raw_email["payload"]:
-                parts = raw_email["payload"]["parts"]
-                # Find the plain text part first
-                part = next((p for p in parts if p["mimeType"] == "text/plain"), None)
-                if part:
-                    data = part["body"]["data"]
-                    body = base64.urlsafe_b64decode(data.encode("ASCII")).decode("utf-8")
-            elif "body" in raw_email["payload"] and "data" in raw_email["payload"]["body"]:
-                data = raw_email["payload"]["body"]["data"]
-                body = base64.urlsafe_b64decode(data.encode("ASCII")).decode("utf-8")
-            
+            subject = headers.get("subject", "")
+            sender = headers.get("from", "")
+            received_at = headers.get("date", "")
+
+            body = _extract_gmail_body(payload)
+
             # Clean up sender format
-            match = re.search(r'<(.+?)>', sender)
+            match = _SENDER_ADDRESS_RE.search(sender)
             if match:
                 sender = match.group(1)
 
+            # Senders and subjects repeat across an inbox; interning shares one string per value
             return Email(
                 id=email_id,
-                sender=sender.strip(),
-                subject=subject.strip(),
-                body=body.strip(),
+                sender=sys.intern(sender.strip()),
+                subject=sys.intern(subject.strip()),
+                body=clean_email_body(body),
                 received_at=received_at.strip(),
             )
         except Exception as e:
@@ -1,15 +1,22 @@
-import json
 import os
-import re
-from typing import List, Dict, Any, Optional, Tuple
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Collection, List, Dict, Any, Optional, Tuple
 import msal
 import requests
-import google.auth
-from google.cloud import secretmanager
 from google.api_core import exceptions as google_exceptions
 from email_assistant.src.agent.state import Email
+from email_assistant.src.config import config
+from email_assistant.src.gcp import access_secret, get_project_id, get_secret_manager_client, invalidate_secret
 from email_assistant.src.logger import logger
-from email_assistant.src.tools.email_fetcher import BaseEmailFetcher
+from email_assistant.src.serialization import JSON_HEADERS, json_dumps, json_loads
+from email_assistant.src.tools.email_fetcher import BaseEmailFetcher, clean_email_body, html_to_text
+
+try:
+    from msal_extensions import PersistedTokenCache, build_encrypted_persistence
+except ImportError:  # pragma: no cover - msal-extensions is optional
+    PersistedTokenCache = None
 
 
 class OutlookFetcher(BaseEmailFetcher):
@@ -23,29 +30,52 @@ class OutlookFetcher(BaseEmailFetcher):
     CREDENTIALS_SECRET_ID = "outlook_credentials"
     TOKEN_SECRET_ID = "outlook-token-cache"
     GRAPH_API_ENDPOINT = "https://graph.microsoft.com/v1.0"
+    # Message fields parse_email reads
+    MESSAGE_FIELDS = "id,receivedDateTime,subject,from,body"
+    # Microsoft Graph JSON batching accepts at most 20 sub-requests per call
+    BATCH_MAX_REQUESTS = 20
+    # Seconds the device flow waits for the user to sign in, generous enough for MFA
+    DEVICE_FLOW_TIMEOUT = 300
 
     def __init__(self):
-        self.sm_client = secretmanager.SecretManagerServiceClient()
-        self.project_id = self._get_project_id()
-        self.token_cache = msal.SerializableTokenCache()
+        self.sm_client = get_secret_manager_client()
+        self.project_id = get_project_id()
+        self.token_cache = self._build_token_cache()
         self.app: Optional[msal.PublicClientApplication] = None
         self.account: Optional[Dict[str, Any]] = None
+        # A single session is reused across connects so pooled Graph connections stay warm for the whole run
+        self.session: Optional[requests.Session] = None
+        # Background connect started by connect_async, shared by callers while it is pending
+        self._connect_executor: Optional[ThreadPoolExecutor] = None
+        self._connect_future: Optional[Future] = None
+        self._connect_lock = threading.Lock()
+        # Serializes token cache uploads so overlapping connects never add secret versions concurrently
+        self._save_lock = threading.Lock()
 
-    def _get_project_id(self) -> Optional[str]:
-        try:
-            _, project_id = google.auth.default()
-            return project_id
-        except google.auth.exceptions.DefaultCredentialsError:
-            return os.getenv("GOOGLE_CLOUD_PROJECT")
+    def _build_token_cache(self) -> msal.SerializableTokenCache:
+        """
+        Returns a token cache persisted to an encrypted local file when msal-extensions is installed,
+        so a new process can reuse its last tokens without reading Secret Manager. Falls back to an
+        in-memory cache, e.g. when the platform offers no encryption backend.
+        """
+        if PersistedTokenCache is not None:
+            try:
+                os.makedirs(os.path.dirname(config.outlook_token_cache_path), exist_ok=True)
+                return PersistedTokenCache(build_encrypted_persistence(config.outlook_token_cache_path))
+            except Exception as e:
+                logger.warning("Local encrypted token cache unavailable, using Secret Manager only: %s", e)
+        return msal.SerializableTokenCache()
 
 
     def _load_cache(self):
         if not self.project_id:
             return
+        if self.token_cache.find(msal.TokenCache.CredentialType.ACCOUNT):
+            logger.info("Using the locally persisted token cache.")
+            return
         try:
-            path = self.sm_client.secret_version_path(self.project_id, self.TOKEN_SECRET_ID, "latest")
-            response = self.sm_client.access_secret_version(request={"name": path})
-            self.token_cache.deserialize(response.payload.data.decode("UTF-8"))
+            token_data = access_secret(self.project_id, self.TOKEN_SECRET_ID)
+            self.token_cache.deserialize(token_data.decode("UTF-8"))
             logger.info(f"Successfully loaded token cache from '{self.TOKEN_SECRET_ID}'.")
         except google_exceptions.NotFound:
             logger.info(f"Secret '{self.TOKEN_SECRET_ID}' not found. A new one will be created after login.")
@@ -54,28 +84,43 @@ class OutlookFetcher(BaseEmailFetcher):
 
 
     def _save_cache(self):
+        """
+        Uploads a changed token cache to Secret Manager on a background thread, so connect does not
+        wait for the round-trip. The thread is not a daemon, so the upload still completes at exit.
+        """
         if not self.project_id or not self.token_cache.has_state_changed:
             return
-        try:
-            payload = self.token_cache.serialize().encode("UTF-8")
-            parent = self.sm_client.secret_path(self.project_id, self.TOKEN_SECRET_ID)            
+        # Serialized here so the upload sees a consistent snapshot; this also resets has_state_changed
+        payload = self.token_cache.serialize().encode("UTF-8")
+        threading.Thread(target=self._upload_cache, args=(payload,), name="outlook-token-cache-upload").start()
+
+
+    def _upload_cache(self, payload: bytes):
+        """
+        Adds the serialized token cache as a new version of the token secret, creating the secret if needed.
+        Uploads hold _save_lock, so the versions of overlapping connects are added one at a time.
+        """
+        with self._save_lock:
             try:
-                # Try to add a new version directly
-                self.sm_client.add_secret_version(request={"parent": parent, "payload": {"data": payload}})
-            except google_exceptions.NotFound:
-                # If the secret itself doesn't exist, create it and then add the version.
-                logger.info(f"Secret '{self.TOKEN_SECRET_ID}' not found. Creating it now.")
-                self.sm_client.create_secret(
-                    parent=f"projects/{self.project_id}",
-                    secret_id=self.TOKEN_SECRET_ID,
-                    secret={
-                        "replication": {"automatic": {}}
-                    }
-                )
-                self.sm_client.add_secret_version(request={"parent": parent, "payload": {"data": payload}})
-            logger.info(f"Successfully saved token cache to Secret Manager '{self.TOKEN_SECRET_ID}'.")
-        except Exception as e:
-            logger.error(f"Failed to save token cache to Secret Manager: {e}")
+                parent = self.sm_client.secret_path(self.project_id, self.TOKEN_SECRET_ID)
+                try:
+                    # Try to add a new version directly
+                    self.sm_client.add_secret_version(request={"parent": parent, "payload": {"data": payload}})
+                except google_exceptions.NotFound:
+                    # If the secret itself doesn't exist, create it and then add the version.
+                    logger.info(f"Secret '{self.TOKEN_SECRET_ID}' not found. Creating it now.")
+                    self.sm_client.create_secret(
+                        parent=f"projects/{self.project_id}",
+                        secret_id=self.TOKEN_SECRET_ID,
+                        secret={
+                            "replication": {"automatic": {}}
+                        }
+                    )
+                    self.sm_client.add_secret_version(request={"parent": parent, "payload": {"data": payload}})
+                invalidate_secret(self.project_id, self.TOKEN_SECRET_ID)
+                logger.info(f"Successfully saved token cache to Secret Manager '{self.TOKEN_SECRET_ID}'.")
+            except Exception as e:
+                logger.error(f"Failed to save token cache to Secret Manager: {e}")
 
 
     def connect(self) -> Optional[requests.Session]:
@@ -85,9 +130,7 @@ class OutlookFetcher(BaseEmailFetcher):
             return None
 
         try:
-            creds_path = self.sm_client.secret_version_path(self.project_id, self.CREDENTIALS_SECRET_ID, "latest")
-            response = self.sm_client.access_secret_version(request={"name": creds_path})
-            ms_creds = json.loads(response.payload.data.decode("UTF-8"))
+            ms_creds = json_loads(access_secret(self.project_id, self.CREDENTIALS_SECRET_ID))
             # Use the 'common' authority to allow both personal (Outlook.com) and work/school accounts.
             # This is more flexible for a public client application and resolves the authority validation error.
             authority = "https://login.microsoftonline.com/common"
@@ -122,11 +165,10 @@ class OutlookFetcher(BaseEmailFetcher):
                 return None
             
             print(flow["message"]) # Instruct user to authenticate
-            # The acquire_token_by_device_flow method is blocking. It polls the token endpoint
-            # until authentication is complete or it times out. We increase the timeout
-            # to give ample time for browser interaction, especially with MFA like Windows Hello.
-            # The timeout is in seconds.
-            result = self.app.acquire_token_by_device_flow(flow, timeout=300)
+            # The acquire_token_by_device_flow method is blocking. It polls the token endpoint at the
+            # flow's interval until authentication is complete or it times out. Use connect_async to
+            # keep the caller free while the user signs in.
+            result = self.app.acquire_token_by_device_flow(flow, timeout=self.DEVICE_FLOW_TIMEOUT)
             # After successful device flow, get the account and store it
             accounts = self.app.get_accounts()
             if accounts:
@@ -136,28 +178,66 @@ class OutlookFetcher(BaseEmailFetcher):
 
         if "access_token" in result:
             logger.info("Successfully acquired MS Graph access token to connect to Outlook.")
-            session = requests.Session()
-            session.headers.update({"Authorization": f"Bearer {result['access_token']}"})
-            return session
+            if self.session is None:
+                self.session = requests.Session()
+            self.session.headers.update({"Authorization": f"Bearer {result['access_token']}"})
+            return self.session
         else:
             logger.error(f"Failed to acquire access token: {result.get('error_description')}")
             return None
 
 
-    def fetch_raw_unread_emails(self, service: requests.Session, max_count: int = 10) -> List[Dict[str, Any]]:
+    def connect_async(self) -> "Future[Optional[requests.Session]]":
         """
-        Fetches unread emails using the Microsoft Graph API.
+        Runs connect on a background thread and returns its Future, so a pending device flow does not
+        block the caller, e.g. while another provider's emails are fetched. Calls made while a connect
+        is still pending share its Future instead of starting a second device flow.
         """
+        with self._connect_lock:
+            if self._connect_future is None or self._connect_future.done():
+                if self._connect_executor is None:
+                    self._connect_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outlook-connect")
+                self._connect_future = self._connect_executor.submit(self.connect)
+            return self._connect_future
+
+
+    def fetch_raw_unread_emails(
+            self,
+            service: requests.Session,
+            max_count: int = 10,
+            exclude_ids: Collection[str] = ()
+    ) -> List[Dict[str, Any]]:
+        """
+        Fetches unread emails using the Microsoft Graph API. Without exclusions this is a single list
+        call returning full messages. With exclusions only IDs are listed first, and the remaining
+        messages are fetched through $batch, so excluded messages are never downloaded again.
+        """
+        if not exclude_ids:
+            return self._list_unread(service, max_count, self.MESSAGE_FIELDS)
+        # Over-fetch the ID listing by the excluded count so up to max_count new messages remain
+        listed = self._list_unread(service, max_count + len(exclude_ids), "id")
+        new_ids = [message["id"] for message in listed if message["id"] not in exclude_ids][:max_count]
+        if not new_ids:
+            return []
+        messages = []
+        for start in range(0, len(new_ids), self.BATCH_MAX_REQUESTS):
+            messages.extend(self._get_messages_batch(service, new_ids[start:start + self.BATCH_MAX_REQUESTS]))
+        logger.info("Fetched %s new unread Outlook messages.", len(messages))
+        return messages
+
+
+    def _list_unread(self, service: requests.Session, top: int, select: str) -> List[Dict[str, Any]]:
+        """Lists the newest unread inbox messages with the given $select fields."""
         query_params = {
             "$filter": "isRead eq false",
-            "$top": max_count,
-            "$select": "id,receivedDateTime,subject,from,body",
+            "$top": top,
+            "$select": select,
             "$orderby": "receivedDateTime desc"
         }
         try:
             response = service.get(f"{self.GRAPH_API_ENDPOINT}/me/mailFolders/inbox/messages", params=query_params)
             response.raise_for_status()
-            messages = response.json().get("value", [])
+            messages = json_loads(response.content).get("value", [])
             if not messages:
                 logger.info("No unread Outlook messages found.")
             logger.info(f"Fetched {len(messages)} unread Outlook messages.")    
@@ -167,6 +247,32 @@ class OutlookFetcher(BaseEmailFetcher):
             return []
 
 
+    def _get_messages_batch(self, service: requests.Session, message_ids: List[str]) -> List[Dict[str, Any]]:
+        """Fetches up to 20 messages with one $batch request, in the given order; failed gets are skipped."""
+        batch_payload = {
+            "requests": [
+                {"id": str(i), "method": "GET", "url": f"/me/messages/{message_id}?$select={self.MESSAGE_FIELDS}"}
+                for i, message_id in enumerate(message_ids)
+            ]
+        }
+        try:
+            response = service.post(f"{self.GRAPH_API_ENDPOINT}/$batch", data=json_dumps(batch_payload), headers=JSON_HEADERS)
+            response.raise_for_status()
+            sub_responses = {item.get("id"): item for item in json_loads(response.content).get("responses", [])}
+        except requests.exceptions.RequestException as e:
+            logger.error("An error occurred fetching %s Outlook emails: %s", len(message_ids), e)
+            return []
+
+        messages = []
+        for i, message_id in enumerate(message_ids):
+            sub_response = sub_responses.get(str(i)) or {}
+            if 200 <= sub_response.get("status", 0) < 300:
+                messages.append(sub_response.get("body") or {})
+            else:
+                logger.error("An error occurred fetching Outlook email %s: HTTP %s", message_id, sub_response.get("status"))
+        return messages
+
+
     def parse_email(self, raw_email: Dict[str, Any]) -> Optional[Email]:
         """Parses a raw email message from MS Graph API into a structured Email."""
         try:
@@ -177,14 +283,14 @@ class OutlookFetcher(BaseEmailFetcher):
             body_content = raw_email.get("body", {})
             body = body_content.get("content", "")
             if body_content.get("contentType") == "html":
-                # Basic HTML tag stripping
-                body = re.sub('<[^<]+?>', '', body)
+                body = html_to_text(body)
 
+            # Senders and subjects repeat across an inbox; interning shares one string per value
             return Email(
                 id=raw_email.get("id", "N/A"),
-                sender=sender_email.strip(),
-                subject=raw_email.get("subject", "").strip(),
-                body=body.strip(),
+                sender=sys.intern(sender_email.strip()),
+                subject=sys.intern(raw_email.get("subject", "").strip()),
+                body=clean_email_body(body),
                 received_at=raw_email.get("receivedDateTime", "").strip(),
             )
         except Exception as e:
@@ -1,8 +1,10 @@
+import functools
 import google.auth
 import google.auth.transport.requests
 import requests
 from email_assistant.src.agent.tools import placeholder_tool
 from email_assistant.src.logger import logger
+from email_assistant.src.serialization import json_loads
 from email_assistant.src.tools.calendar_tools import OutlookCalendarTool
 from email_assistant.src.tools.email_fetcher import BaseEmailFetcher
 from email_assistant.src.tools.outlook_fetcher import OutlookFetcher
@@ -25,41 +27,50 @@ def get_tools(email_fetcher: BaseEmailFetcher) -> list:
 def get_gcp_identity():
     """
     Inspects the application's default credentials to find the authenticated
-    user or service account email.
+    user or service account email. The identity is resolved once per process;
+    failures are not cached, so a later call retries.
     """
     try:
-        # Get the credentials and project from the environment
-        credentials, project_id = google.auth.default()
-
-        # For service accounts, the email is directly available
-        if hasattr(credentials, 'service_account_email'):
-            logger.info(f"Running as service account: {credentials.service_account_email}")
-            return credentials.service_account_email
-
-        # For user accounts, we need to inspect the access token
-        # Refresh the credentials to make sure we have a valid access token
-        credentials.refresh(google.auth.transport.requests.Request())
-        
-        # Call the tokeninfo endpoint
-        token_info_url = f"https://www.googleapis.com/oauth2/v3/tokeninfo?access_token={credentials.token}"
-        response = requests.get(token_info_url)
-        response.raise_for_status()
-        
-        token_info = response.json()
-        email = token_info.get("email")
-
-        if email:
-            logger.info(f"Running as user: {email}")
-            return email
-        else:
-            logger.warning("Could not determine user email from token.")
-            return None
-
+        return _resolve_gcp_identity()
     except Exception as e:
         logger.error(f"Failed to determine GCP identity: {e}")
         return None
 
 
+@functools.cache
+def _resolve_gcp_identity():
+    """Looks up the identity behind the default credentials, raising on failure."""
+    # Get the credentials and project from the environment
+    credentials, project_id = google.auth.default()
+
+    # For service accounts, the email is directly available
+    if hasattr(credentials, 'service_account_email'):
+        logger.info(f"Running as service account: {credentials.service_account_email}")
+        return credentials.service_account_email
+
+    # For user accounts, we need to inspect the access token
+    # Refresh the credentials to make sure we have a valid access token
+    credentials.refresh(google.auth.transport.requests.Request())
+
+    # Call the tokeninfo endpoint
+    token_info_url = f"https://www.googleapis.com/oauth2/v3/tokeninfo?access_token={credentials.token}"
+    response = requests.get(token_info_url)
+    response.raise_for_status()
+
+    token_info = json_loads(response.content)
+    email = token_info.get("email")
+
+    if not email:
+        # Raised rather than returned, so the missing email is not cached and a later call retries
+        raise ValueError("Could not determine user email from token.")
+    logger.info(f"Running as user: {email}")
+    return email
+
+
+# Lets callers force a fresh lookup, e.g. after switching credentials
+get_gcp_identity.cache_clear = _resolve_gcp_identity.cache_clear
+
+
 if __name__ == '__main__':
     # Example of how to use it
     identity = get_gcp_identity()
@@ -1,29 +1,34 @@
 import unittest
+from types import SimpleNamespace
 from unittest.mock import patch, MagicMock
 
 from email_assistant.src.agent.graph import build_agent_workflow_graph
 from email_assistant.src.tools.outlook_fetcher import OutlookFetcher
 from email_assistant.src.agent.state import Email
 
+# The LLM output is an object with a .content attribute holding the batched JSON reply; a plain
+# namespace is enough and, unlike a MagicMock, records nothing when the node reads it
+_SPAM_RESPONSE = SimpleNamespace(content='[{"i": 0, "label": "spam"}]')
+
 class TestSimpleTriageFlow(unittest.TestCase):
 
-    @patch('email_assistant.src.agent.email_actions.OutlookActions.mark_as_spam')
-    @patch('email_assistant.src.agent.nodes.llm')
-    def test_spam_email_is_triaged_and_marked_as_spam(self, mock_llm, mock_mark_as_spam):
+    @patch('email_assistant.src.agent.email_actions.OutlookActions.mark_many_as_spam')
+    @patch('email_assistant.src.llm_factory.LLMFactory.get_instance')
+    def test_spam_email_is_triaged_and_marked_as_spam(self, mock_get_instance, mock_mark_many_as_spam):
         """
         Tests the full flow for a spam email:
         1. Fetch a fake email.
         2. Mock the LLM to classify it as 'spam'.
         3. Verify the simple_triage_node is called.
-        4. Verify that the mark_as_spam action is called with the correct email ID.
+        4. Verify that the batched mark_many_as_spam action is called with the correct email ID.
         """
         # --- 1. Arrange (Setup Mocks) ---
 
-        # Mock the LLM to return 'spam' classification
-        # The LLM output is an object with a .content attribute
-        mock_llm.invoke.return_value = MagicMock(content="spam")
+        # Mock the LLM to return a 'spam' classification for the single inbox email
+        mock_llm = mock_get_instance.return_value
+        mock_llm.invoke.return_value = _SPAM_RESPONSE
         # Mock the action client's method to prevent real API calls
-        mock_mark_as_spam.return_value = {"status": "success", "email_id": "test-spam-email-123"}
+        mock_mark_many_as_spam.return_value = [{"status": "success", "email_id": "test-spam-email-123"}]
         # Create a fake email object
         test_email = Email(
             id='test-spam-email-123',
@@ -50,18 +55,21 @@ class TestSimpleTriageFlow(unittest.TestCase):
         final_state = graph.invoke(inputs)
 
         # --- 3. Assert (Check the Results) ---
-        # Verify that the LLM was called to classify
+        # Verify that the LLM was called once to classify the whole inbox
         mock_llm.invoke.assert_called_once()
-        # Verify that mark_as_spam was called exactly once
-        mock_mark_as_spam.assert_called_once()
+        # Verify that the buffered spam was flushed in exactly one bulk call
+        mock_mark_many_as_spam.assert_called_once()
         # Verify it was called with the correct email ID
-        called_args, called_kwargs = mock_mark_as_spam.call_args
-        self.assertEqual(called_kwargs.get('email_id'), test_email['id'])
+        called_args, called_kwargs = mock_mark_many_as_spam.call_args
+        self.assertEqual(called_args[0], [test_email['id']])
 
         # Verify the final state of the graph
         self.assertIn('test-spam-email-123', final_state['processed_email_ids'])
         self.assertEqual(len(final_state['inbox']), 0)
-        self.assertIsNone(final_state['current_email']) # Should be cleared by the end
+        # Per-email state stays inside the process_email subgraph and is never handed back
+        self.assertNotIn('current_email', final_state)
+        # The spam buffer is cleared once it has been flushed
+        self.assertEqual(final_state['pending_spam_ids'], [])
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from email_assistant.src.tools.calendar_tools import OutlookCalendarTool
+
+
+def _response(status_code: int, content: bytes = b"{}") -> SimpleNamespace:
+    return SimpleNamespace(status_code=status_code, content=content, raise_for_status=lambda: None)
+
+
+@patch('email_assistant.src.tools.calendar_tools.time.monotonic')
+class TestOutlookCalendarToolToken(unittest.TestCase):
+
+    def setUp(self):
+        self.fetcher = MagicMock()
+        self.acquire_token = self.fetcher.app.acquire_token_silent
+        self.acquire_token.side_effect = [
+            {"access_token": "token-1", "expires_in": 3600},
+            {"access_token": "token-2", "expires_in": 3600},
+        ]
+        self.tool = OutlookCalendarTool(self.fetcher)
+        self.tool.session.request = MagicMock(return_value=_response(200))
+
+    def test_token_is_reused_until_the_refresh_margin(self, mock_monotonic):
+        mock_monotonic.return_value = 1000.0
+        self.assertEqual(self.tool._get_access_token(), "token-1")
+        # Just before expiry minus TOKEN_REFRESH_MARGIN the cached token is still returned
+        mock_monotonic.return_value = 1000.0 + 3600 - OutlookCalendarTool.TOKEN_REFRESH_MARGIN - 1
+        self.assertEqual(self.tool._get_access_token(), "token-1")
+        self.acquire_token.assert_called_once()
+        self.assertEqual(self.tool.session.headers["Authorization"], "Bearer token-1")
+
+    def test_token_is_refreshed_once_the_deadline_passes(self, mock_monotonic):
+        mock_monotonic.return_value = 1000.0
+        self.tool._get_access_token()
+        mock_monotonic.return_value = 1000.0 + 3600 - OutlookCalendarTool.TOKEN_REFRESH_MARGIN
+        self.assertEqual(self.tool._get_access_token(), "token-2")
+        self.assertEqual(self.acquire_token.call_count, 2)
+        self.assertEqual(self.tool.session.headers["Authorization"], "Bearer token-2")
+
+    def test_rejected_token_is_refreshed_and_the_call_retried_once(self, mock_monotonic):
+        mock_monotonic.return_value = 1000.0
+        self.tool.session.request.side_effect = [_response(401), _response(200, b'{"value": []}')]
+
+        result = self.tool._make_api_call("GET", "/me/events")
+
+        self.assertEqual(result, {"value": []})
+        self.assertEqual(self.tool.session.request.call_count, 2)
+        self.assertEqual(self.acquire_token.call_args.kwargs["force_refresh"], True)
+        self.assertEqual(self.tool.session.headers["Authorization"], "Bearer token-2")
+
+    def test_unconnected_fetcher_raises(self, mock_monotonic):
+        mock_monotonic.return_value = 1000.0
+        self.fetcher.account = None
+        with self.assertRaises(Exception):
+            self.tool._get_access_token()
+        self.acquire_token.assert_not_called()
+
+    def test_failed_silent_acquisition_raises(self, mock_monotonic):
+        mock_monotonic.return_value = 1000.0
+        self.acquire_token.side_effect = [{"error": "invalid_grant"}]
+        with self.assertRaises(Exception):
+            self.tool._get_access_token()
+        self.assertNotIn("Authorization", self.tool.session.headers)
+
+
+class TestCreateEventValidation(unittest.TestCase):
+
+    def setUp(self):
+        self.tool = OutlookCalendarTool(MagicMock())
+
+    def _build(self, start_time: str, end_time: str = "2024-08-01T11:00:00Z"):
+        return self.tool._build_create_event_request("Sync", ["a@example.com"], start_time, end_time)
+
+    def test_valid_times_are_accepted(self):
+        for value in ("2024-08-01T10:00:00Z", "2024-02-29T10:00", "2024-08-01T10:00:00.123+05:30"):
+            with self.subTest(value=value):
+                request = self._build(value)
+                self.assertEqual(request["body"]["start"]["dateTime"], value)
+
+    def test_invalid_times_are_rejected_locally(self):
+        invalid = (
+            "2024-02-31T10:00:00Z", "2023-02-29T10:00", "2024-04-31T10:00",
+            "२०२४-01-01T10:00", "2024-13-01T10:00", "2024-08-01 10:00", "tomorrow at 10",
+        )
+        for value in invalid:
+            with self.subTest(value=value):
+                with self.assertRaisesRegex(ValueError, "Invalid date format for start_time"):
+                    self._build(value)
+
+    def test_invalid_end_time_is_named(self):
+        with self.assertRaisesRegex(ValueError, "end_time"):
+            self._build("2024-08-01T10:00:00Z", "2024-08-32T10:00:00Z")
+
+
+if __name__ == '__main__':
+    unittest.main()
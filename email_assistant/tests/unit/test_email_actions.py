@@ -0,0 +1,134 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import requests
+
+from email_assistant.src.agent.email_actions import GmailActions, OutlookActions
+from email_assistant.src.serialization import json_dumps, json_loads
+
+
+class TestGmailMarkManyAsSpam(unittest.TestCase):
+
+    def setUp(self):
+        self.service = MagicMock()
+        self.batch_modify = self.service.users.return_value.messages.return_value.batchModify
+        self.actions = GmailActions(service=self.service)
+
+    def test_ids_are_sent_in_chunks_of_1000(self):
+        """Each batchModify call carries at most 1000 IDs and the spam label changes."""
+        email_ids = [f"id-{i}" for i in range(2500)]
+
+        results = self.actions.mark_many_as_spam(email_ids)
+
+        bodies = [call.kwargs['body'] for call in self.batch_modify.call_args_list]
+        self.assertEqual([len(body['ids']) for body in bodies], [1000, 1000, 500])
+        self.assertEqual([email_id for body in bodies for email_id in body['ids']], email_ids)
+        for body in bodies:
+            self.assertEqual(body['addLabelIds'], ['SPAM'])
+            self.assertEqual(body['removeLabelIds'], ['INBOX', 'UNREAD'])
+        self.assertEqual([result['email_id'] for result in results], email_ids)
+        self.assertTrue(all(result['status'] == 'success' for result in results))
+
+    def test_failed_chunk_marks_only_its_ids_as_errors(self):
+        """batchModify has no per-message results, so every ID of a failed chunk shares its error."""
+        email_ids = [f"id-{i}" for i in range(1500)]
+        self.batch_modify.return_value.execute.side_effect = [{}, RuntimeError("quota exceeded")]
+
+        results = self.actions.mark_many_as_spam(email_ids)
+
+        self.assertEqual([result['status'] for result in results], ['success'] * 1000 + ['error'] * 500)
+        self.assertEqual(results[1000], {"status": "error", "email_id": "id-1000", "error": "quota exceeded"})
+
+    def test_no_ids_makes_no_calls(self):
+        self.assertEqual(self.actions.mark_many_as_spam([]), [])
+        self.batch_modify.assert_not_called()
+
+
+class TestOutlookMarkManyAsSpam(unittest.TestCase):
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.adapters = {}
+        self.actions = OutlookActions(client=self.client)
+        # IDs the fake $batch endpoint reports as failed
+        self.failing_ids = set()
+        self.client.post.side_effect = self._batch_response
+
+    def _batch_response(self, url, data, headers):
+        """Answers a $batch call with one sub-response per move, in reverse order like Graph may."""
+        responses = []
+        for request in json_loads(data)["requests"]:
+            email_id = request["url"].split("/")[3]
+            if email_id in self.failing_ids:
+                responses.append({"id": request["id"], "status": 404, "body": {"error": {"message": "Item not found"}}})
+            else:
+                responses.append({"id": request["id"], "status": 201, "body": {"id": f"moved-{email_id}"}})
+        return SimpleNamespace(content=json_dumps({"responses": responses[::-1]}), raise_for_status=lambda: None)
+
+    def test_moves_are_sent_in_batches_of_20(self):
+        email_ids = [f"id-{i}" for i in range(45)]
+
+        results = self.actions.mark_many_as_spam(email_ids)
+
+        batches = [json_loads(call.kwargs['data'])["requests"] for call in self.client.post.call_args_list]
+        self.assertEqual(sorted(len(batch) for batch in batches), [5, 20, 20])
+        for call in self.client.post.call_args_list:
+            self.assertEqual(call.args[0], f"{OutlookActions.GRAPH_API_ENDPOINT}/$batch")
+        self.assertEqual([result['email_id'] for result in results], email_ids)
+        self.assertTrue(all(result['status'] == 'success' for result in results))
+
+    def test_sub_responses_are_mapped_back_to_their_email(self):
+        """Results follow the input order whatever order Graph returns the sub-responses in."""
+        self.failing_ids = {"id-1"}
+
+        results = self.actions.mark_many_as_spam(["id-0", "id-1", "id-2"])
+
+        self.assertEqual(results, [
+            {"status": "success", "email_id": "id-0", "result": {"id": "moved-id-0"}},
+            {"status": "error", "email_id": "id-1", "error": "Item not found"},
+            {"status": "success", "email_id": "id-2", "result": {"id": "moved-id-2"}},
+        ])
+
+    def test_missing_sub_response_is_an_error(self):
+        self.client.post.side_effect = lambda url, data, headers: SimpleNamespace(
+            content=json_dumps({"responses": []}), raise_for_status=lambda: None
+        )
+
+        results = self.actions.mark_many_as_spam(["id-0"])
+
+        self.assertEqual(results[0]["status"], "error")
+
+    def test_failed_batch_marks_all_its_emails_as_errors(self):
+        self.client.post.side_effect = requests.exceptions.ConnectionError("connection reset")
+
+        results = self.actions.mark_many_as_spam(["id-0", "id-1"])
+
+        self.assertEqual(results, [
+            {"status": "error", "email_id": "id-0", "error": "connection reset"},
+            {"status": "error", "email_id": "id-1", "error": "connection reset"},
+        ])
+
+
+class TestOutlookConnectionPool(unittest.TestCase):
+
+    def test_only_get_requests_are_retried(self):
+        """Moves are POSTs that must not be repeated; throttled GETs wait for Retry-After."""
+        session = requests.Session()
+        OutlookActions(client=session)
+
+        retry = session.adapters[OutlookActions.GRAPH_API_ENDPOINT].max_retries
+        self.assertEqual(set(retry.allowed_methods), {"GET"})
+        self.assertIn(429, retry.status_forcelist)
+        self.assertTrue(retry.respect_retry_after_header)
+
+    def test_adapter_is_mounted_once_per_session(self):
+        session = requests.Session()
+        OutlookActions(client=session)
+        adapter = session.adapters[OutlookActions.GRAPH_API_ENDPOINT]
+        OutlookActions(client=session)
+        self.assertIs(session.adapters[OutlookActions.GRAPH_API_ENDPOINT], adapter)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import base64
+import unittest
+from unittest.mock import MagicMock, patch
+
+from email_assistant.src.config import config
+from email_assistant.src.tools.email_fetcher import (
+    _TRUNCATION_MARKER,
+    GmailFetcher,
+    _extract_gmail_body,
+    clean_email_body,
+)
+
+
+def _part(mime_type: str, text: str = None, parts: list = None) -> dict:
+    """Builds a Gmail payload part with a base64url body (unpadded, as Gmail sends it)."""
+    part = {"mimeType": mime_type, "body": {}}
+    if text is not None:
+        part["body"]["data"] = base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii").rstrip("=")
+    if parts is not None:
+        part["parts"] = parts
+    return part
+
+
+class TestExtractGmailBody(unittest.TestCase):
+
+    def test_single_part_body_is_used_as_is(self):
+        self.assertEqual(_extract_gmail_body(_part("text/plain", "Hello")), "Hello")
+
+    def test_plain_text_is_preferred_over_html(self):
+        payload = _part("multipart/alternative", parts=[
+            _part("text/html", "<p>Hello from HTML</p>"),
+            _part("text/plain", "Hello from text"),
+        ])
+        self.assertEqual(_extract_gmail_body(payload), "Hello from text")
+
+    def test_nested_multipart_is_searched_depth_first(self):
+        """The first text/plain part in document order wins, however deeply it is nested."""
+        payload = _part("multipart/mixed", parts=[
+            _part("multipart/related", parts=[
+                _part("multipart/alternative", parts=[
+                    _part("text/plain", "First plain part"),
+                    _part("text/html", "<p>First HTML part</p>"),
+                ]),
+                _part("image/png", "not text"),
+            ]),
+            _part("text/plain", "Attached text file"),
+        ])
+        self.assertEqual(_extract_gmail_body(payload), "First plain part")
+
+    def test_html_only_mail_is_converted_to_text(self):
+        payload = _part("multipart/mixed", parts=[
+            _part("multipart/alternative", parts=[_part("text/html", "<p>Only <b>HTML</b> here</p>")]),
+            _part("text/html", "<p>Second HTML part</p>"),
+        ])
+        body = _extract_gmail_body(payload)
+        self.assertNotIn("<", body)
+        self.assertIn("Only", body)
+        self.assertIn("HTML", body)
+        self.assertNotIn("Second", body)
+
+    def test_non_ascii_and_invalid_utf8(self):
+        self.assertEqual(_extract_gmail_body(_part("text/plain", "नमस्ते ✓")), "नमस्ते ✓")
+        invalid = {"mimeType": "text/plain", "body": {"data": base64.urlsafe_b64encode(b"ok \xff").decode("ascii")}}
+        self.assertEqual(_extract_gmail_body(invalid), "ok �")
+
+    def test_payload_without_text_parts(self):
+        payload = _part("multipart/mixed", parts=[_part("image/png", "binary")])
+        self.assertEqual(_extract_gmail_body(payload), "")
+
+
+class TestCleanEmailBody(unittest.TestCase):
+
+    def test_whitespace_is_normalized(self):
+        body = "  Hi team,  \r\n\r\n\r\n\r\nPlease review.\t\r\nThanks  \n\n"
+        self.assertEqual(clean_email_body(body), "Hi team,\n\nPlease review.\nThanks")
+
+    def test_body_within_budget_is_kept_whole(self):
+        with patch.object(config, 'max_body_chars', 100):
+            self.assertEqual(clean_email_body("x" * 100), "x" * 100)
+
+    def test_long_body_keeps_its_head_and_tail(self):
+        """Three quarters of the budget come from the start of the body and one quarter from its end."""
+        body = "".join(chr(ord("a") + i % 26) for i in range(1000))
+        with patch.object(config, 'max_body_chars', 100):
+            cleaned = clean_email_body(body)
+        self.assertEqual(cleaned, body[:75] + _TRUNCATION_MARKER + body[-25:])
+
+    def test_empty_body(self):
+        self.assertEqual(clean_email_body(" \r\n "), "")
+
+
+class _FakeBatch:
+    """Gmail batch HTTP request answering its gets in reverse order, with an error for the failing IDs."""
+
+    def __init__(self, callback, failing_ids, batches):
+        self.callback = callback
+        self.failing_ids = failing_ids
+        self.request_ids = []
+        batches.append(self.request_ids)
+
+    def add(self, request, request_id):
+        self.request_ids.append(request_id)
+
+    def execute(self):
+        for request_id in reversed(self.request_ids):
+            if request_id in self.failing_ids:
+                self.callback(request_id, None, RuntimeError("not found"))
+            else:
+                self.callback(request_id, {"id": request_id}, None)
+
+
+class TestGmailFetchRawUnreadEmails(unittest.TestCase):
+
+    def setUp(self):
+        self.service = MagicMock()
+        self.failing_ids = set()
+        self.batches = []
+        self.service.new_batch_http_request.side_effect = lambda callback: _FakeBatch(callback, self.failing_ids, self.batches)
+        self.fetcher = GmailFetcher()
+
+    def _list_ids(self, message_ids):
+        self.service.users.return_value.messages.return_value.list.return_value.execute.return_value = {
+            "messages": [{"id": message_id} for message_id in message_ids]
+        }
+
+    def test_messages_keep_the_list_order_and_failed_gets_are_skipped(self):
+        self._list_ids(["m3", "m1", "m2", "m4"])
+        self.failing_ids.add("m2")
+
+        raw_emails = self.fetcher.fetch_raw_unread_emails(self.service, max_count=10)
+
+        self.assertEqual([raw_email["id"] for raw_email in raw_emails], ["m3", "m1", "m4"])
+
+    def test_gets_are_sent_in_batches_of_100(self):
+        message_ids = [f"m{i}" for i in range(250)]
+        self._list_ids(message_ids)
+
+        raw_emails = self.fetcher.fetch_raw_unread_emails(self.service, max_count=250)
+
+        self.assertEqual([len(batch) for batch in self.batches], [100, 100, 50])
+        self.assertEqual([raw_email["id"] for raw_email in raw_emails], message_ids)
+
+    def test_excluded_and_duplicate_ids_are_not_fetched(self):
+        self._list_ids(["m1", "m2", "m1", "m3", "m4"])
+
+        raw_emails = self.fetcher.fetch_raw_unread_emails(self.service, max_count=2, exclude_ids={"m2"})
+
+        self.assertEqual(self.batches, [["m1", "m3"]])
+        self.assertEqual([raw_email["id"] for raw_email in raw_emails], ["m1", "m3"])
+
+    def test_no_unread_messages(self):
+        self._list_ids([])
+        self.assertEqual(self.fetcher.fetch_raw_unread_emails(self.service, max_count=10), [])
+        self.service.new_batch_http_request.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from email_assistant.src.agent.nodes import classify_inbox_node
+from email_assistant.src.agent.state import Email
+
+
+def _email(email_id: str, subject: str) -> Email:
+    return Email(id=email_id, sender='sender@example.com', subject=subject, body='Body', received_at='2025-09-22T10:00:00Z')
+
+
+class TestClassifyInboxNode(unittest.TestCase):
+
+    @patch('email_assistant.src.agent.nodes._classify_chain')
+    @patch('email_assistant.src.llm_factory.LLMFactory.get_instance')
+    def test_unresolved_emails_are_classified_individually_on_every_cycle(self, mock_get_instance, mock_classify_chain):
+        """
+        Emails the batched reply leaves unresolved get one call each, in inbox order, on every fetch cycle;
+        a failed call leaves only its own email unresolved.
+        """
+        # The batched reply resolves only the first email
+        mock_get_instance.return_value.invoke.return_value = SimpleNamespace(content='[{"i": 0, "label": "spam"}]')
+        labels = {"Invoice": "invoice", "Meeting": "meeting"}
+
+        def _classify(inputs):
+            if inputs["email_subject"] not in labels:
+                raise RuntimeError("LLM unavailable")
+            return SimpleNamespace(label=labels[inputs["email_subject"]])
+
+        mock_classify_chain.return_value.invoke.side_effect = _classify
+        inbox = [_email('1', 'Offer'), _email('2', 'Invoice'), _email('3', 'Broken'), _email('4', 'Meeting')]
+
+        for _ in range(2):
+            update = classify_inbox_node({"inbox": inbox})
+            self.assertEqual(update["classifications"], ["spam", "invoice", None, "meeting"])
+        self.assertEqual(mock_classify_chain.return_value.invoke.call_count, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import requests
+
+from email_assistant.src.serialization import json_dumps, json_loads
+from email_assistant.src.tools.outlook_fetcher import OutlookFetcher
+
+
+class TestOutlookGetMessagesBatch(unittest.TestCase):
+
+    def setUp(self):
+        # _get_messages_batch needs no credentials or token cache, so __init__ (which resolves both) is skipped
+        self.fetcher = OutlookFetcher.__new__(OutlookFetcher)
+        self.service = MagicMock()
+        # IDs the fake $batch endpoint reports as failed
+        self.failing_ids = set()
+        self.service.post.side_effect = self._batch_response
+
+    def _batch_response(self, url, data, headers):
+        """Answers a $batch call with one sub-response per get, in reverse order like Graph may."""
+        responses = []
+        for request in json_loads(data)["requests"]:
+            message_id = request["url"].split("/")[3].split("?")[0]
+            if message_id in self.failing_ids:
+                responses.append({"id": request["id"], "status": 404, "body": {"error": {"message": "Not found"}}})
+            else:
+                responses.append({"id": request["id"], "status": 200, "body": {"id": message_id}})
+        return SimpleNamespace(content=json_dumps({"responses": responses[::-1]}), raise_for_status=lambda: None)
+
+    def test_messages_keep_the_given_order_and_failed_gets_are_skipped(self):
+        self.failing_ids.add("m2")
+
+        messages = self.fetcher._get_messages_batch(self.service, ["m3", "m1", "m2", "m4"])
+
+        self.assertEqual(messages, [{"id": "m3"}, {"id": "m1"}, {"id": "m4"}])
+        requests_sent = json_loads(self.service.post.call_args.kwargs["data"])["requests"]
+        self.assertTrue(all(f"$select={OutlookFetcher.MESSAGE_FIELDS}" in request["url"] for request in requests_sent))
+
+    def test_failed_batch_returns_no_messages(self):
+        self.service.post.side_effect = requests.exceptions.ConnectionError("connection reset")
+        self.assertEqual(self.fetcher._get_messages_batch(self.service, ["m1"]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
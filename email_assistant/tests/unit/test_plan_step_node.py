@@ -0,0 +1,45 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from langchain_core.messages import AIMessage
+
+from email_assistant.src.agent.graph import build_email_processing_graph
+from email_assistant.src.agent.state import Email
+
+
+class TestPlanStepCache(unittest.TestCase):
+
+    @patch('email_assistant.src.llm_factory.LLMFactory.get_instance')
+    def test_failed_step_is_not_replayed_from_cache(self, mock_get_instance):
+        """
+        A planning step whose LLM call failed must not be answered from the cache: the same
+        email processed again reaches the LLM and records its response instead of the old error.
+        """
+        llm_with_tools = MagicMock()
+        # plan_step and its uncached retry both fail for the first email, then the LLM recovers
+        llm_with_tools.invoke.side_effect = [RuntimeError("LLM unavailable"), RuntimeError("LLM unavailable"), AIMessage(content="done")]
+        mock_get_instance.return_value.bind_tools.return_value = llm_with_tools
+        test_email = Email(
+            id='test-meeting-email-123',
+            sender='colleague@example.com',
+            subject='Sync tomorrow?',
+            body='Can we meet tomorrow at 10?',
+            received_at='2025-09-22T10:00:00Z'
+        )
+        graph = build_email_processing_graph()
+        inputs = {"current_email": test_email, "classification": "meeting", "run_date": "2025-09-22"}
+
+        first_run = list(graph.stream(inputs, stream_mode="updates"))
+        second_run = list(graph.stream(inputs, stream_mode="updates"))
+
+        # The failed run records the error and still finishes the email
+        first_retry = next(update["plan_step_retry"] for update in first_run if "plan_step_retry" in update)
+        self.assertIn("LLM failed to respond", first_retry["messages"][0].content)
+        # The second run replays only the route, so the LLM is called again and its response recorded
+        second_retry = next(update["plan_step_retry"] for update in second_run if "plan_step_retry" in update)
+        self.assertEqual(second_retry["messages"][0].content, "done")
+        self.assertEqual(llm_with_tools.invoke.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import string
+import unittest
+
+from email_assistant.src.prompts.prompt_manager import _compile_template, prompt_manager
+
+
+def _sample_variables(template: str) -> dict:
+    """One distinct value per field, including characters that must survive f-string compilation."""
+    return {
+        field: f"<{field} {{braces}} 'quotes' \"double\" \\backslash\n>"
+        for _, field, _, _ in string.Formatter().parse(template)
+        if field
+    }
+
+
+class TestCompileTemplate(unittest.TestCase):
+
+    def test_every_prompt_renders_like_format_map(self):
+        prompts = {name: prompt for name, prompt in prompt_manager._prompts.items() if isinstance(prompt, str)}
+        self.assertTrue(prompts)
+        for name, template in prompts.items():
+            with self.subTest(prompt=name):
+                variables = _sample_variables(template)
+                self.assertEqual(prompt_manager.format(name, **variables), template.format_map(variables))
+
+    def test_templates_render_like_format_map(self):
+        templates = [
+            "",
+            "no fields at all",
+            "{a} and {b}, then {a} again",
+            "escaped {{braces}} around {a}",
+            "quotes ' \" ''' \"\"\" and backslashes \\n {a}",
+            "multi\nline\n{a}\n",
+            "unicode {a} बापदादा",
+            # Fall back to format_map
+            "spec {a:>10}",
+            "conversion {a!r}",
+            "attribute {a.__class__}",
+            "index {a[0]}",
+        ]
+        for template in templates:
+            with self.subTest(template=template):
+                variables = {"a": "x", "b": "y"}
+                self.assertEqual(_compile_template(template)(**variables), template.format_map(variables))
+
+    def test_unused_variables_are_ignored(self):
+        self.assertEqual(_compile_template("{a}")(a="x", unused="y"), "x")
+
+    def test_malformed_template_fails_when_rendered(self):
+        """A template str.format cannot parse still loads, and raises like format_map when rendered."""
+        render = _compile_template("unbalanced {a")
+        with self.assertRaises(ValueError):
+            render(a="x")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from email_assistant.src.utils import get_gcp_identity
+
+
+def _user_credentials() -> MagicMock:
+    """User credentials: no service_account_email, so the email is read from the tokeninfo endpoint."""
+    return MagicMock(spec=["refresh", "token"], token="access-token")
+
+
+@patch('email_assistant.src.utils.requests.get')
+@patch('email_assistant.src.utils.google.auth.default')
+class TestGetGcpIdentity(unittest.TestCase):
+
+    def setUp(self):
+        get_gcp_identity.cache_clear()
+
+    def tearDown(self):
+        get_gcp_identity.cache_clear()
+
+    def _tokeninfo(self, content: bytes) -> SimpleNamespace:
+        return SimpleNamespace(content=content, raise_for_status=lambda: None)
+
+    def test_service_account_identity_is_resolved_once(self, mock_default, mock_get):
+        mock_default.return_value = (SimpleNamespace(service_account_email="agent@project.iam.gserviceaccount.com"), "project")
+
+        self.assertEqual(get_gcp_identity(), "agent@project.iam.gserviceaccount.com")
+        self.assertEqual(get_gcp_identity(), "agent@project.iam.gserviceaccount.com")
+
+        mock_default.assert_called_once()
+        mock_get.assert_not_called()
+
+    def test_user_identity_is_read_from_tokeninfo(self, mock_default, mock_get):
+        mock_default.return_value = (_user_credentials(), "project")
+        mock_get.return_value = self._tokeninfo(b'{"email": "user@example.com"}')
+
+        self.assertEqual(get_gcp_identity(), "user@example.com")
+        self.assertEqual(get_gcp_identity(), "user@example.com")
+
+        mock_get.assert_called_once()
+
+    def test_missing_email_is_not_cached(self, mock_default, mock_get):
+        """A token without an email returns None, and the next call looks the identity up again."""
+        mock_default.return_value = (_user_credentials(), "project")
+        mock_get.side_effect = [self._tokeninfo(b'{}'), self._tokeninfo(b'{"email": "user@example.com"}')]
+
+        self.assertIsNone(get_gcp_identity())
+        self.assertEqual(get_gcp_identity(), "user@example.com")
+
+    def test_failed_lookup_is_not_cached(self, mock_default, mock_get):
+        mock_default.side_effect = [RuntimeError("no credentials"), (_user_credentials(), "project")]
+        mock_get.return_value = self._tokeninfo(b'{"email": "user@example.com"}')
+
+        self.assertIsNone(get_gcp_identity())
+        self.assertEqual(get_gcp_identity(), "user@example.com")
+
+
+if __name__ == '__main__':
+    unittest.main()
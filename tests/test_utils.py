@@ -0,0 +1,55 @@
+import unittest
+
+from utils import _DATE_FORMAT_BY_GROUP, _DATE_RE, _parse_date_match, extract_date_from_text
+
+
+def _parse_first(text: str):
+    """Parses the first _DATE_RE match in text the way extract_date_from_text does."""
+    match = _DATE_RE.search(text)
+    _, year_first, two_digit_year = _DATE_FORMAT_BY_GROUP[match.lastgroup]
+    return _parse_date_match(match, year_first, two_digit_year)
+
+
+class TestExtractDateFromText(unittest.TestCase):
+
+    def test_each_format_is_parsed(self):
+        cases = {
+            "Murli 2025-09-08": "2025-09-08",
+            "Murli 08.09.2025": "2025-09-08",
+            "Murli 8/9/2025": "2025-09-08",
+            "Murli 08-09-2025": "2025-09-08",
+            "Murli 08.09.25": "2025-09-08",
+            "Murli 8/9/25": "2025-09-08",
+            "Murli 08-09-25": "2025-09-08",
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(extract_date_from_text(text), expected)
+
+    def test_leftmost_date_wins(self):
+        """The first date in the text is returned, whatever the order of the patterns."""
+        self.assertEqual(extract_date_from_text("from 08/09/25 to 2025-10-01"), "2025-09-08")
+
+    def test_four_digit_year_is_preferred_at_the_same_position(self):
+        self.assertEqual(extract_date_from_text("08-09-2025"), "2025-09-08")
+
+    def test_two_digit_year_pivots_at_69(self):
+        self.assertEqual(_parse_first("31/12/68").year, 2068)
+        self.assertEqual(_parse_first("01/01/69").year, 1969)
+        self.assertEqual(_parse_first("01/01/00").year, 2000)
+
+    def test_invalid_date_is_skipped_for_the_next_one(self):
+        self.assertEqual(extract_date_from_text("31/02/2024 then 01/03/2024"), "2024-03-01")
+
+    def test_devanagari_digits(self):
+        self.assertEqual(extract_date_from_text("प्रात:मुरली ०८-०९-२०२५"), "2025-09-08")
+
+    def test_return_date_format(self):
+        self.assertEqual(extract_date_from_text("2025-09-08", return_date_format="%d/%m/%Y"), "08/09/2025")
+
+    def test_no_date(self):
+        self.assertIsNone(extract_date_from_text("no date here 123"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,12 @@
 from typing import Optional
+from functools import lru_cache
+import os
 import re
 import json
 import unicodedata # Added for character category checking
 import codecs
 from logger import logger
-from langdetect import detect, LangDetectException, DetectorFactory
+from langdetect import detect, detector_factory, LangDetectException, DetectorFactory
 from langchain_core.documents import Document
 from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
 from typing import List 
@@ -13,13 +15,64 @@ from google.cloud import firestore
 from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.memory import InMemorySaver
 
+# Seed langdetect once at import so detection is reproducible
+DetectorFactory.seed = 0
+# langdetect profiles loaded for detection: Hindi Murli content, English prompts and neighbouring Indic
+# languages. Text in any other language is reported as the closest of these.
+_DETECT_LANGUAGES = ("en", "hi", "bn", "mr", "ne", "ur")
+# Any Latin letter: ASCII text containing one is English, the only Latin-script language above
+_ASCII_LETTER_RE = re.compile(r"[A-Za-z]")
+
+# Maps Devanagari numerals to ASCII digits for str.translate
+_DEVANAGARI_DIGITS = str.maketrans("०१२३४५६७८९", "0123456789")
+
+# Specific date patterns to avoid ambiguity, with the 4-digit-year ones first. \d also matches
+# Devanagari numerals, and the 1-2 digit day/month patterns also cover the fixed 2-digit ones.
+# Each pattern captures its three fields in the order of its format.
+_DATE_PATTERNS = (
+    (r"(\d{4})-(\d{2})-(\d{2})", "%Y-%m-%d"), # YYYY-MM-DD
+    (r"(\d{1,2})\.(\d{1,2})\.(\d{4})", "%d.%m.%Y"), # D.M.YYYY, DD.MM.YYYY
+    (r"(\d{1,2})/(\d{1,2})/(\d{4})", "%d/%m/%Y"), # D/M/YYYY, DD/MM/YYYY
+    (r"(\d{1,2})-(\d{1,2})-(\d{4})", "%d-%m-%Y"), # D-M-YYYY, DD-MM-YYYY
+    (r"(\d{1,2})\.(\d{1,2})\.(\d{2})", "%d.%m.%y"), # D.M.YY, DD.MM.YY
+    (r"(\d{1,2})/(\d{1,2})/(\d{2})", "%d/%m/%y"), # D/M/YY, DD/MM/YY
+    (r"(\d{1,2})-(\d{1,2})-(\d{2})", "%d-%m-%y"), # D-M-YY, DD-MM-YY
+    # Add other common formats if needed (e.g., "January 21, 1969")
+)
+# All patterns as one alternation with a named group each, so a single scan finds the first date in the
+# text; at a given position the alternatives are tried in the order above. The group name gives the format.
+# The leading lookahead lets the engine skip non-digit positions without entering the alternation.
+_DATE_RE = re.compile(
+    r"(?=\d)(?:" + "|".join(f"(?P<f{i}>{pattern})" for i, (pattern, _) in enumerate(_DATE_PATTERNS)) + ")"
+)
+# Per group: (format, whether the year comes first, whether the year has two digits)
+_DATE_FORMAT_BY_GROUP = {
+    f"f{i}": (date_format, date_format.startswith("%Y"), "%y" in date_format)
+    for i, (_, date_format) in enumerate(_DATE_PATTERNS)
+}
+
+
 def _devanagari_to_ascii_digits(devanagari_string: str) -> str:
     """Converts Devanagari numerals in a string to ASCII digits."""
-    mapping = {
-        '०': '0', '१': '1', '२': '2', '३': '3', '४': '4',
-        '५': '5', '६': '6', '७': '7', '८': '8', '९': '9'
-    }
-    return "".join(mapping.get(char, char) for char in devanagari_string)
+    return devanagari_string.translate(_DEVANAGARI_DIGITS)
+
+
+def _parse_date_match(match: re.Match, year_first: bool, two_digit_year: bool) -> datetime:
+    """
+    Builds the datetime for a _DATE_RE match from its captured fields, without strptime's format
+    parsing. int() reads Devanagari digits directly. Two-digit years pivot like strptime's %y.
+    """
+    # The alternative's named group closes last, so its three fields are the groups right after it
+    first_field = match.lastindex + 1
+    fields = match.group(first_field, first_field + 1, first_field + 2)
+    if year_first:
+        year, month, day = fields
+    else:
+        day, month, year = fields
+    year = int(year)
+    if two_digit_year:
+        year += 2000 if year < 69 else 1900
+    return datetime(year, int(month), int(day))
 
 
 def extract_date_from_text(text: str, return_date_format: str = "%Y-%m-%d") -> Optional[str]:
@@ -31,75 +84,63 @@ def extract_date_from_text(text: str, return_date_format: str = "%Y-%m-%d") -> O
     Returns:
         str or None: The extracted date in return_date_format if found, otherwise None.
     """
-    # Specific date patterns to avoid ambiguity
-    date_patterns = [
-        (r"(\d{4})-(\d{2})-(\d{2})", "%Y-%m-%d"),  # YYYY-MM-DD
-        (r"([०-९]{4})-([०-९]{2})-([०-९]{2})", "%Y-%m-%d"), # YYYY-MM-DD (Devanagari)
-
-        (r"(\d{2})/(\d{2})/(\d{4})", "%d/%m/%Y"), # DD/MM/YYYY
-        (r"([०-९]{2})/([०-९]{2})/([०-९]{4})", "%d/%m/%Y"), # DD/MM/YYYY (Devanagari)
-
-        (r"(\d{2})\.(\d{2})\.(\d{4})", "%d.%m.%Y"), # DD.MM.YYYY
-        (r"([०-९]{2})\.([०-९]{2})\.([०-९]{4})", "%d.%m.%Y"), # DD.MM.YYYY (Devanagari)
-
-        (r"(\d{1,2})\.(\d{1,2})\.(\d{4})", "%d.%m.%Y"), # D.M.YYYY, DD.M.YYYY, D.MM.YYYY
-        (r"([०-९]{1,2})\.([०-९]{1,2})\.([०-९]{4})", "%d.%m.%Y"), # D.M.YYYY (Devanagari)
-
-        (r"(\d{1,2})/(\d{1,2})/(\d{4})", "%d/%m/%Y"), # D/M/YYYY, DD/M/YYYY, D/MM/YYYY
-        (r"([०-९]{1,2})/([०-९]{1,2})/([०-९]{4})", "%d/%m/%Y"), # D/M/YYYY (Devanagari)
-
-        (r"(\d{1,2})-(\d{1,2})-(\d{4})", "%d-%m-%Y"), # D-M-YYYY, DD-M-YYYY, D-MM-YYYY
-        (r"([०-९]{1,2})-([०-९]{1,2})-([०-९]{4})", "%d-%m-%Y"), # D-M-YYYY (Devanagari)
-
-        (r"(\d{2})\.(\d{2})\.(\d{2})", "%d.%m.%y"), # DD.MM.YY
-        (r"([०-९]{2})\.([०-९]{2})\.([०-९]{2})", "%d.%m.%y"), # DD.MM.YY (Devanagari)
-
-        (r"(\d{2})/(\d{2})/(\d{2})", "%d/%m/%y"), # DD/MM/YY
-        (r"([०-९]{2})/([०-९]{2})/([०-९]{2})", "%d/%m/%y"), # DD/MM/YY (Devanagari)
-
-        (r"(\d{2})-(\d{2})-(\d{2})", "%d-%m-%y"), # DD-MM-YY
-        (r"([०-९]{2})-([०-९]{2})-([०-९]{2})", "%d-%m-%y"), # DD-MM-YY (Devanagari)
-
-        (r"(\d{1,2})\.(\d{1,2})\.(\d{2})", "%d.%m.%y"), # D.M.YY, DD.M.YY, D.MM.YY
-        (r"([०-९]{1,2})\.([०-९]{1,2})\.([०-९]{2})", "%d.%m.%y"), # D.M.YY (Devanagari)
-
-        (r"(\d{1,2})/(\d{1,2})/(\d{2})", "%d/%m/%y"), # D/M/YY, DD/M/YY, D/MM/YY
-        (r"([०-९]{1,2})/([०-९]{1,2})/([०-९]{2})", "%d/%m/%y"), # D/M/YY (Devanagari)
-
-        (r"(\d{1,2})-(\d{1,2})-(\d{2})", "%d-%m-%y"), # D-M-YY, DD-M-YY, D-MM-YY
-        (r"([०-९]{1,2})-([०-९]{1,2})-([०-९]{2})", "%d-%m-%y"), # D-M-YY (Devanagari)
-        # Add other common formats if needed (e.g., "January 21, 1969")
-    ]
-
-    for pattern, date_format in date_patterns:
-        match = re.search(pattern, text)
-        if match:
+    # Dates that match a pattern but do not parse (e.g. 31/02/2024) are skipped in favour of the next one
+    for match in _DATE_RE.finditer(text):
+        date_format, year_first, two_digit_year = _DATE_FORMAT_BY_GROUP[match.lastgroup]
+        try:
+            date_obj = _parse_date_match(match, year_first, two_digit_year)
+            return date_obj.strftime(return_date_format)
+        except ValueError as e:
             matched_date_str = match.group(0)
-            ascii_date_str = _devanagari_to_ascii_digits(matched_date_str)
-            try:
-                # Attempt to parse the date using the specified format
-                date_obj = datetime.strptime(ascii_date_str, date_format)
-                return date_obj.strftime(return_date_format)
-            except ValueError as e:
-                logger.warning(f"Date format '{date_format}' matched for '{matched_date_str}' (converted to '{ascii_date_str}'), but couldn't parse. Error: {e}")                
-            except Exception as e:
-                    logger.error(f"Unexpected error parsing date '{matched_date_str}' (converted to '{ascii_date_str}') with format '{date_format}': {e}")                    
+            logger.warning(f"Date format '{date_format}' matched for '{matched_date_str}' (converted to '{_devanagari_to_ascii_digits(matched_date_str)}'), but couldn't parse. Error: {e}")                
+        except Exception as e:
+            logger.error(f"Unexpected error parsing date '{match.group(0)}' with format '{date_format}': {e}")                    
 
     logger.info(f"No date pattern matched in text: '{text[:100]}...'")
     return None 
 
 
+def _init_language_factory() -> None:
+    """
+    Installs langdetect's shared detector factory with only the _DETECT_LANGUAGES profiles, before
+    detect() would load all 55 of them. This keeps tens of MB of n-gram tables out of memory and
+    scores each text against 6 profiles instead of 55.
+    """
+    if detector_factory._factory is not None:
+        return
+    profiles = []
+    for lang in _DETECT_LANGUAGES:
+        with open(os.path.join(detector_factory.PROFILES_DIRECTORY, lang), encoding="utf-8") as f:
+            profiles.append(f.read())
+    factory = DetectorFactory()
+    factory.load_json_profile(profiles)
+    detector_factory._factory = factory
+
+
+@lru_cache(maxsize=128)
+def _detect_language(text: str) -> str:
+    """
+    Memoized langdetect call: the same extracted content recurs across agent iterations and retries.
+    Keyed on the text itself, whose hash CPython computes once per string object.
+    """
+    _init_language_factory()
+    return detect(text)
+
+
 def detect_text_language(text: str, default_lang: str = 'en') -> str:
     """
     Detects the language of the user question using langdetect.
     Falls back to default_lang if detection fails.
     """    
-    DetectorFactory.seed = 0  # Set seed for reproducibility
     try:
         if not text.strip():
             logger.warning("Empty text provided for language detection. Defaulting to '%s'.", default_lang)
             return default_lang
-        detected_lang = detect(text)
+        if text.isascii() and _ASCII_LETTER_RE.search(text):
+            # str.isascii is O(1) in CPython, so ASCII text skips the n-gram scoring entirely
+            detected_lang = 'en'
+        else:
+            detected_lang = _detect_language(text)
         logger.info(f"Detected language '{detected_lang}' for text.")
         return detected_lang
     except LangDetectException as lang_err:
@@ -1,15 +1,107 @@
 import asyncio
+import os
+import uuid
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator
 from langgraph.graph import StateGraph, END
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import ToolNode
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage, trim_messages
+from langchain_core.messages.utils import count_tokens_approximately
 from logger import logger
 from web_content_extraction_agent.process_tavily_extract_output import process_tavily_tools
 from web_content_extraction_agent.config import Config  
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools
 from web_content_extraction_agent.state import AgentState
 
+# Checkpoints are persisted to SQLite when langgraph-checkpoint-sqlite is installed, otherwise kept in memory
+try:
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+except ImportError:  # pragma: no cover - langgraph-checkpoint-sqlite is optional
+    AsyncSqliteSaver = None
+
+# Opening instructions of the extraction run
+_SYSTEM_PROMPT = (
+    "I need you to extract the hindi murli content for date 2025-09-08 "
+    "from the website: https://www.babamurli.com/. To achieve this we "
+    "need to proceed step by step.\n\n"
+    "Step 1: Use available tools to find the url for the web page that "
+    "contains hindi murli for 2025-09-08 from the website: "
+    "https://www.babamurli.com/. Start by exploring the website structure "
+    "using tavily-map tool to understand how they organize their content. "
+    "Use the following arguments for tavily-map:\n"
+    '{\n'
+    '  "url": "https://www.babamurli.com/",\n'
+    '  "limit": 30,\n'
+    '  "max_depth": 2,\n'
+    '  "instructions": "Find pages related to Hindi Murli content, daily murli, or date-specific content"\n'
+    '}\n\n'
+    "Step 2: Once you have found the correct url, your ONLY action should be "
+    "to call tavily-extract with the provided URL. The tool call would "
+    "return the murli contents from that URL.\n\n"
+    "Please start with Step 1."
+)
+# Guiding prompts added after each tool runs, filled in with the tool's (processed) output
+_MAP_GUIDING_PROMPT = (
+    "The `tavily-map` tool has returned the following site map:\n\n"
+    "```\n{content}\n```\n\n"
+    "Please analyze this site map and proceed with the next step of the plan: "
+    "find the specific URL for the hindi murli for date 2025-09-08 and then call the `tavily-extract` tool with that single URL."
+)
+_EXTRACT_GUIDING_PROMPT = (
+    "The `tavily-extract` tool has run and the content has been processed. Here is the extracted page content:\n\n"
+    "```\n{content}\n```\n\n"
+    "This is the final step. Please present the extracted hindi murli content to the user as your final answer. "
+    "Do not call any more tools."
+)
+# Word present in any Murli text; a message containing it carries the extracted content
+_MURLI_MARKER = "बापदादा"
+
+
+def _track_murli_content(state: AgentState, message: BaseMessage) -> None:
+    """Sets final_marker_seen once a message carrying Murli content is added to the conversation."""
+    if not state.get("final_marker_seen") and isinstance(message.content, str) and _MURLI_MARKER in message.content:
+        state["final_marker_seen"] = True
+
+
+def _trim_prompt_messages(messages: list[BaseMessage], max_tokens: int) -> list[BaseMessage]:
+    """
+    Returns the messages to send to the LLM: the task prompt, followed by the most recent messages that
+    fit the remaining token budget. The window starts on a HumanMessage so no tool result is sent without
+    the call that requested it. The newest message is always sent even if it alone exceeds the budget,
+    together with the AIMessage that requested it when it is a tool result.
+    """
+    # The approximate counter avoids a count-tokens API call
+    if count_tokens_approximately(messages) <= max_tokens:
+        return list(messages)
+    task_prompt, history = messages[0], messages[1:]
+    if not history:
+        return [task_prompt]
+    recent = trim_messages(
+        history,
+        max_tokens=max(max_tokens - count_tokens_approximately([task_prompt]), 0),
+        strategy="last",
+        start_on="human",
+        token_counter=count_tokens_approximately
+    ) or _newest_turn(history)
+    return [task_prompt, *recent]
+
+
+def _newest_turn(history: list[BaseMessage]) -> list[BaseMessage]:
+    """
+    Returns the newest message, or when it is a tool result, the AIMessage that made the call followed
+    by its tool results, so the provider never receives a tool result without its call.
+    """
+    start = len(history) - 1
+    while start > 0 and isinstance(history[start], ToolMessage):
+        start -= 1
+    if start < len(history) - 1 and isinstance(history[start], AIMessage):
+        return history[start:]
+    return history[-1:]
+
 
 class WebContentExtractionAgent:
     def __init__(self, config: Config):
@@ -17,37 +109,49 @@ class WebContentExtractionAgent:
         self.llm = None
         self.tools = []
         self.mcp_client = None
+        # The tavily-mcp session stays open for the agent's lifetime (see get_mcp_server_tools) and is closed by close()
+        self._mcp_stack = AsyncExitStack()
+        self._mcp_session = None
     
 
     async def get_mcp_server_tools(self, config_instance: Config):
         """
-        Returns a list of MCP server tools.
+        Returns a list of MCP server tools. The tools share one session with the tavily-mcp server,
+        opened on the first call and reused by later calls, so the npx server is launched once per
+        agent rather than once per tool call. The API key reaches the server through its environment.
         """
-        if config_instance.DEV_MODE:
-            tavily_mcp_command = f"export TAVILY_API_KEY='{config_instance.TAVILY_API_KEY}' && " \
-                                "source /home/bk_anupam/.nvm/nvm.sh > /dev/null 2>&1 && " \
-                                "nvm use v22.14.0 > /dev/null 2>&1 && " \
-                                "npx --quiet -y tavily-mcp@0.2.1"
-        else:
-            tavily_mcp_command = f"export TAVILY_API_KEY='{config_instance.TAVILY_API_KEY}' && " \
-                                "npx --quiet -y tavily-mcp@0.2.1"
+        if self._mcp_session is None:
+            if config_instance.DEV_MODE:
+                tavily_mcp_command = "source /home/bk_anupam/.nvm/nvm.sh > /dev/null 2>&1 && " \
+                                    "nvm use v22.14.0 > /dev/null 2>&1 && " \
+                                    "npx --quiet -y tavily-mcp@0.2.1"
+            else:
+                tavily_mcp_command = "npx --quiet -y tavily-mcp@0.2.1"
 
-        mcp_client = MultiServerMCPClient(
-            {
-                "tavily-mcp": {
-                    "command": "bash",
-                    "args": [
-                        "-c",
-                        tavily_mcp_command
-                    ],
-                    "transport": "stdio",
-                },
-            }
-        )
-        tools = await mcp_client.get_tools()
+            self.mcp_client = MultiServerMCPClient(
+                {
+                    "tavily-mcp": {
+                        "command": "bash",
+                        "args": [
+                            "-c",
+                            tavily_mcp_command
+                        ],
+                        "env": {"TAVILY_API_KEY": config_instance.TAVILY_API_KEY},
+                        "transport": "stdio",
+                    },
+                }
+            )
+            self._mcp_session = await self._mcp_stack.enter_async_context(self.mcp_client.session("tavily-mcp"))
+        tools = await load_mcp_tools(self._mcp_session)
         return tools
 
 
+    async def close(self):
+        """Closes the tavily-mcp session, which stops the server process."""
+        await self._mcp_stack.aclose()
+        self._mcp_session = None
+
+
     async def initialize(self):
         """Initialize the LLM and tools"""        
         self.llm = ChatGoogleGenerativeAI(
@@ -68,28 +172,7 @@ class WebContentExtractionAgent:
         async def agent_node(state: AgentState) -> AgentState:
             # Get the last message or create initial prompt
             if not state["messages"]:                
-                system_prompt = (
-                    "I need you to extract the hindi murli content for date 2025-09-08 "
-                    "from the website: https://www.babamurli.com/. To achieve this we "
-                    "need to proceed step by step.\n\n"
-                    "Step 1: Use available tools to find the url for the web page that "
-                    "contains hindi murli for 2025-09-08 from the website: "
-                    "https://www.babamurli.com/. Start by exploring the website structure "
-                    "using tavily-map tool to understand how they organize their content. "
-                    "Use the following arguments for tavily-map:\n"
-                    '{\n'
-                    '  "url": "https://www.babamurli.com/",\n'
-                    '  "limit": 30,\n'
-                    '  "max_depth": 2,\n'
-                    '  "instructions": "Find pages related to Hindi Murli content, daily murli, or date-specific content"\n'
-                    '}\n\n'
-                    "Step 2: Once you have found the correct url, your ONLY action should be "
-                    "to call tavily-extract with the provided URL. The tool call would "
-                    "return the murli contents from that URL.\n\n"
-                    "Please start with Step 1."
-                )
-                
-                state["messages"] = [HumanMessage(content=system_prompt)]
+                state["messages"] = [HumanMessage(content=_SYSTEM_PROMPT)]
             
             # If a tool just ran, add a specific guiding prompt based on which tool was executed.
             # This makes the agent more robust, especially for 'flash' models.
@@ -97,36 +180,27 @@ class WebContentExtractionAgent:
                 last_tool_message = state["messages"][-1]                
                 if last_tool_message.name == "tavily-map":
                     # Inject the tool's output directly into the guiding prompt.
-                    guiding_prompt = (
-                        f"The `tavily-map` tool has returned the following site map:\n\n"
-                        f"```\n{last_tool_message.content}\n```\n\n"
-                        "Please analyze this site map and proceed with the next step of the plan: "
-                        "find the specific URL for the hindi murli for date 2025-09-08 and then call the `tavily-extract` tool with that single URL."
-                    )
+                    guiding_prompt = _MAP_GUIDING_PROMPT.format(content=last_tool_message.content)
                     state["messages"].append(HumanMessage(content=guiding_prompt))
                 elif last_tool_message.name == "tavily-extract":
-                    # After processing, the clean content is in state['documents'].
+                    # After processing, the clean content of state['documents'] is in state['documents_text'].
                     # We use this clean content to prompt the LLM for the final answer.
-                    extracted_content = ""
-                    if state.get("documents"):
-                        extracted_content = "\n\n".join([doc.page_content for doc in state["documents"]])
-
-                    guiding_prompt = (
-                        f"The `tavily-extract` tool has run and the content has been processed. Here is the extracted page content:\n\n"
-                        f"```\n{extracted_content}\n```\n\n"
-                        "This is the final step. Please present the extracted hindi murli content to the user as your final answer. "
-                        "Do not call any more tools."
-                    )
+                    guiding_prompt = _EXTRACT_GUIDING_PROMPT.format(content=state.get("documents_text") or "")
                     state["messages"].append(HumanMessage(content=guiding_prompt))
+                    _track_murli_content(state, state["messages"][-1])
             
             # Ensure we have messages to send
             if not state["messages"]:
                 logger.error("No messages to send to LLM")
                 return state
                 
+            # Send the task prompt and only the most recent messages that fit the prompt budget; the processed
+            # documents already hold what older tool output contributed
+            messages = _trim_prompt_messages(state["messages"], self.config.MAX_PROMPT_TOKENS)
             # Get response from LLM using the processed messages
-            response = await self.llm_with_tools.ainvoke(state["messages"])
+            response = await self.llm_with_tools.ainvoke(messages)
             state["messages"].append(response)            
+            _track_murli_content(state, response)
             return state
         
         return agent_node
@@ -139,17 +213,32 @@ class WebContentExtractionAgent:
 
     def create_process_tool_output_node(self):
         """Create a node to process the output of tools, specifically tavily-extract."""
-        def process_tool_output_node(state: AgentState) -> AgentState:
+        async def process_tool_output_node(state: AgentState) -> AgentState:
             last_message = state["messages"][-1]
             if not isinstance(last_message, ToolMessage):
                 return state
 
+            processed_ids = state.get("processed_tool_call_ids") or []
+            if last_message.tool_call_id in processed_ids:
+                # Already parsed, and its content replaced by a short note, on an earlier pass
+                return state
+
             if last_message.name == "tavily-extract":
+                state["processed_tool_call_ids"] = [*processed_ids, last_message.tool_call_id]
+                state["tavily_extract_seen"] = True
+                _track_murli_content(state, last_message)
                 logger.info(f"Processing output from tool: {last_message.name}")
-                updated_state = process_tavily_tools(last_message.name, last_message.content, state)
+                updated_state = await process_tavily_tools(last_message.name, last_message.content, state)
                 # Merge the updated state
                 state["documents"] = updated_state.get("documents", [])
+                state["documents_text"] = updated_state.get("documents_text", "")
                 logger.info(f"Updated state with {len(state['documents'])} processed documents.")
+                if state["documents"]:
+                    # The agent's guiding prompt carries the deduplicated content, so the raw page (with its
+                    # duplicate copies of the Murli) is not sent to the LLM a second time
+                    state["messages"][-1] = last_message.model_copy(update={
+                        "content": f"Extracted content processed into {len(state['documents'])} document(s)."
+                    })
             
             return state
         return process_tool_output_node
@@ -161,16 +250,30 @@ class WebContentExtractionAgent:
         # If the last message has tool calls, execute them
         if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
             return "tools"        
-        # Check if we have successfully extracted content
-        messages_content = " ".join([msg.content for msg in state["messages"] if hasattr(msg, 'content') and msg.content])        
-        # If tavily-extract has been called and content is present, we're done
-        if "tavily-extract" in messages_content and any("बापदादा" in msg.content.lower() for msg in state["messages"] if hasattr(msg, 'content') and msg.content):
+        # If tavily-extract has been called and content is present, we're done. Both flags are set by the
+        # nodes as messages are added, so this check does not rescan the whole conversation on every step
+        if state.get("tavily_extract_seen") and state.get("final_marker_seen"):
             return "end"        
         # Continue the conversation
         return "continue"
     
 
-    def create_graph(self):
+    @asynccontextmanager
+    async def open_checkpointer(self) -> AsyncIterator[BaseCheckpointSaver]:
+        """
+        Opens the checkpointer for the agent graph: an AsyncSqliteSaver in CHECKPOINT_DIR, so checkpoints
+        survive a crash and their writes do not block the event loop, or a MemorySaver if it is not installed.
+        """
+        if AsyncSqliteSaver is None:
+            yield MemorySaver()
+            return
+        os.makedirs(self.config.CHECKPOINT_DIR, exist_ok=True)
+        db_path = os.path.join(self.config.CHECKPOINT_DIR, "checkpoints.sqlite")
+        async with AsyncSqliteSaver.from_conn_string(db_path) as checkpointer:
+            yield checkpointer
+
+
+    def create_graph(self, checkpointer: BaseCheckpointSaver = None):
         """Create the complete LangGraph workflow"""
         workflow = StateGraph(AgentState)        
         # Create nodes
@@ -196,9 +299,8 @@ class WebContentExtractionAgent:
         # After tools, go to processing node, then back to the agent
         workflow.add_edge("tools", "process_tool_output")
         workflow.add_edge("process_tool_output", "agent")
-        # Compile with memory
-        memory = MemorySaver()
-        agent_graph = workflow.compile(checkpointer=memory)        
+        # Compile with the given checkpointer, or in-memory checkpoints
+        agent_graph = workflow.compile(checkpointer=checkpointer or MemorySaver())
         return agent_graph    
 
 
@@ -212,7 +314,17 @@ async def execute_agent_graph(agent_graph: StateGraph, config_dict):
     # Return Value: An AsyncIterator. You loop over it with async for.
     # Execution: Each iteration of the loop gives you an event dictionary, which contains the name of the node 
     #            that just ran and the resulting state of the graph at that moment.
-    async for event in agent_graph.astream({"messages": []}, config_dict):
+    # Every key starts out empty, so a run resumed from an existing checkpoint thread never inherits the
+    # previous run's documents or its completion flags
+    initial_state = {
+        "messages": [],
+        "documents": [],
+        "documents_text": "",
+        "tavily_extract_seen": False,
+        "final_marker_seen": False,
+        "processed_tool_call_ids": []
+    }
+    async for event in agent_graph.astream(initial_state, config_dict):
         for node_name, node_state in event.items():
             logger.info(f"Executing node: {node_name}")
             if node_name != "process_tool_output":                
@@ -232,7 +344,7 @@ async def execute_agent_graph(agent_graph: StateGraph, config_dict):
     if final_state:
         # Look for the final extracted content
         for message in reversed(final_state["messages"]):
-            if hasattr(message, 'content') and message.content and "बापदादा" in message.content.lower():
+            if hasattr(message, 'content') and message.content and _MURLI_MARKER in message.content:
                 logger.info("Hindi Murli content successfully extracted!")
                 logger.info(f"Content preview: {message.content[:500]}...")
                 break
@@ -249,12 +361,16 @@ async def execute_agent_graph(agent_graph: StateGraph, config_dict):
 async def main():    
     config = Config()    
     agent = WebContentExtractionAgent(config)
-    await agent.initialize()    
-    # Create the graph
-    app = agent.create_graph()  
-    # Configuration for the run
-    config_dict = {"configurable": {"thread_id": "hindi_murli_extraction_session"}}    
-    await execute_agent_graph(app, config_dict)
+    try:
+        await agent.initialize()    
+        async with agent.open_checkpointer() as checkpointer:
+            # Create the graph
+            app = agent.create_graph(checkpointer)
+            # Configuration for the run; each run gets its own checkpoint thread
+            config_dict = {"configurable": {"thread_id": f"hindi_murli_extraction_{uuid.uuid4().hex}"}}
+            await execute_agent_graph(app, config_dict)
+    finally:
+        await agent.close()
     
 
 if __name__ == "__main__":
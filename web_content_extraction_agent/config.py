@@ -20,6 +20,12 @@ class Config:
     # Read the model name, providing a default value.
     MODEL_NAME: str = os.getenv("MODEL_NAME", "gemini-2.5-flash")
 
+    # Approximate token budget of the messages sent to the LLM per agent step; older messages are left out first.
+    MAX_PROMPT_TOKENS: int = int(os.getenv("MAX_PROMPT_TOKENS", 32000))
+
+    # Directory of the persistent checkpoint database (used when langgraph-checkpoint-sqlite is installed).
+    CHECKPOINT_DIR: str = os.getenv("CHECKPOINT_DIR", "./checkpoints")
+
     # Fail fast if required secrets are not configured.
     if not TAVILY_API_KEY or not GOOGLE_API_KEY:
         raise ValueError("TAVILY_API_KEY and GOOGLE_API_KEY must be set in the environment or a .env file.")
\ No newline at end of file
@@ -1,4 +1,4 @@
-import re
+import asyncio
 from typing import Any, Dict, List, Tuple
 from web_content_extraction_agent.state import AgentState
 from logger import logger
@@ -6,6 +6,10 @@ import utils
 from datetime import timezone, datetime
 from langchain_core.documents import Document
 
+# Upper bound on the characters of raw content processed per tavily-extract call, so a misbehaving
+# tool cannot make deduplication, date and language detection run over an unbounded payload
+_MAX_RAW_CONTENT_CHARS = 2 * 1024 * 1024
+
 def _extract_url(tool_content: str) -> str:
     """ Extract URL from the tool content if present. """    
     url = ""
@@ -20,31 +24,33 @@ def _extract_url(tool_content: str) -> str:
     return url
 
 
-def _deduplicate_text(extracted_text: str) -> str:
+def _deduplicate_text(text: str, start: int = 0, end: int = None) -> str:
     """ Deduplication logic for Murli content Use the specific phrase "प्रात:मुरली"as a delimiter
-    to isolate the unique Murli content, preventing context bloating.    
+    to isolate the unique Murli content, preventing context bloating. Only text[start:end] is
+    considered, and only the returned content is copied out of text.
     """
     keyword = "प्रात:मुरली"        
-    # Find all start indices of the keyword
-    indices = [m.start() for m in re.finditer(re.escape(keyword), extracted_text)]        
-    deduplicated_text = extracted_text # Default to original text
-    if len(indices) > 1:
-        # If the keyword is found more than once, the unique content is the slice
-        # from the beginning of the first occurrence to the beginning of the second.
-        start_pos = indices[0]
-        end_pos = indices[1]            
-        # The content often starts with a date on the same line as the keyword.
-        # To include the full line, we find the last newline before the first keyword.
-        line_start_pos = extracted_text.rfind('\n', 0, start_pos)
-        if line_start_pos == -1:
-            line_start_pos = 0 # Keyword is on the very first line        
-        deduplicated_text = extracted_text[line_start_pos:end_pos].strip()
-        logger.info(f"Deduplicated murli content fetched using tavily-extract. "
-                    f"Original length: {len(extracted_text)}, New length: {len(deduplicated_text)}")
+    if end is None:
+        end = len(text)
+    # Only the first two occurrences matter, so find them directly instead of scanning for all of them
+    start_pos = text.find(keyword, start, end)
+    end_pos = text.find(keyword, start_pos + len(keyword), end) if start_pos != -1 else -1
+    if end_pos == -1:
+        return text[start:end] # Default to original text
+    # If the keyword is found more than once, the unique content is the slice
+    # from the beginning of the first occurrence to the beginning of the second.
+    # The content often starts with a date on the same line as the keyword.
+    # To include the full line, we find the last newline before the first keyword.
+    line_start_pos = text.rfind('\n', start, start_pos)
+    if line_start_pos == -1:
+        line_start_pos = start # Keyword is on the very first line        
+    deduplicated_text = text[line_start_pos:end_pos].strip()
+    logger.info(f"Deduplicated murli content fetched using tavily-extract. "
+                f"Original length: {end - start}, New length: {len(deduplicated_text)}")
     return deduplicated_text
 
 
-def _extract_tavily_extract_content(tool_content: str) -> Tuple[List[str], List[Dict[str, Any]]]:
+async def _extract_tavily_extract_content(tool_content: str) -> Tuple[List[str], List[Dict[str, Any]]]:
     """Extract content from tavily-extract tool output."""
     
     logger.info("Processing tavily-extract tool output (string parsing for extracted content)")    
@@ -58,17 +64,29 @@ def _extract_tavily_extract_content(tool_content: str) -> Tuple[List[str], List[
             logger.warning("Could not find 'Raw Content:' marker in tavily-extract output")
             return docs_content, docs_metadata
         
+        # Bounds of the stripped extracted text, found by index so the (possibly multi-MB) raw content
+        # is not copied before deduplication keeps only the part it needs
         text_start_pos = raw_content_start_idx + len(raw_content_marker)
-        extracted_text = tool_content[text_start_pos:].strip()        
+        text_end_pos = len(tool_content)
+        if text_end_pos - text_start_pos > _MAX_RAW_CONTENT_CHARS:
+            logger.warning(f"tavily-extract raw content exceeds {_MAX_RAW_CONTENT_CHARS} characters, processing only the start of it")
+            text_end_pos = text_start_pos + _MAX_RAW_CONTENT_CHARS
+        while text_start_pos < text_end_pos and tool_content[text_start_pos].isspace():
+            text_start_pos += 1
+        while text_end_pos > text_start_pos and tool_content[text_end_pos - 1].isspace():
+            text_end_pos -= 1
         
-        if not extracted_text:
+        if text_start_pos == text_end_pos:
             logger.warning("No extracted text found in tavily-extract output")
             return docs_content, docs_metadata
         
-        deduplicated_text = _deduplicate_text(extracted_text)                
+        deduplicated_text = _deduplicate_text(tool_content, text_start_pos, text_end_pos)                
         url = _extract_url(tool_content)
-        doc_date = utils.extract_date_from_text(deduplicated_text)
-        doc_language = utils.detect_text_language(deduplicated_text)        
+        # Both passes are CPU-bound and independent: run them in worker threads so the event loop stays free
+        doc_date, doc_language = await asyncio.gather(
+            asyncio.to_thread(utils.extract_date_from_text, deduplicated_text),
+            asyncio.to_thread(utils.detect_text_language, deduplicated_text)
+        )
         docs_content.append(deduplicated_text)        
         metadata = {}
         if url:
@@ -85,12 +103,12 @@ def _extract_tavily_extract_content(tool_content: str) -> Tuple[List[str], List[
     return docs_content, docs_metadata
 
 
-def process_tavily_tools(tool_name: str, tool_content: str, state: AgentState) -> Dict[str, Any]:
+async def process_tavily_tools(tool_name: str, tool_content: str, state: AgentState) -> Dict[str, Any]:
     """Process Tavily web search tool output."""
     if tool_name == "tavily-extract":
-        docs_content, docs_metadata = _extract_tavily_extract_content(tool_content)    
+        docs_content, docs_metadata = await _extract_tavily_extract_content(tool_content)    
 
-    updated_state = {"documents": []}    
+    updated_state = {"documents": [], "documents_text": ""}    
 
     if docs_content:
         # Add retrieval timestamp and source type to metadata
@@ -104,6 +122,8 @@ def process_tavily_tools(tool_name: str, tool_content: str, state: AgentState) -
             for c, m in zip(docs_content, docs_metadata)
         ]
         updated_state["documents"] = tavily_documents                
+        # Joined once here so prompts can use the text without walking the Documents again
+        updated_state["documents_text"] = "\n\n".join(docs_content)
         logger.info(f"Processed {len(tavily_documents)} documents from {tool_name} and updated agent state.")        
     else:
         logger.warning(f"No document content extracted from Tavily tool {tool_name}.")
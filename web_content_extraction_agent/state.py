@@ -2,8 +2,19 @@
 from typing import Optional, TypedDict, List, Annotated, Sequence
 from langchain_core.messages import BaseMessage
 from langchain_core.documents import Document
+from langgraph.graph.message import add_messages
 
 class AgentState(TypedDict):
-    messages: Annotated[Sequence[BaseMessage], "The messages in the conversation"]
+    # The messages in the conversation; add_messages appends each node's new messages (and replaces those
+    # it rewrote, matched by ID) instead of letting the ToolNode's output overwrite the history
+    messages: Annotated[Sequence[BaseMessage], add_messages]
     # To store retrieved docs from any source
     documents: Optional[List[Document]]
+    # page_content of the documents joined by blank lines, built once when they are stored
+    documents_text: Optional[str]
+    # Set once a tavily-extract result has been processed
+    tavily_extract_seen: Optional[bool]
+    # Set once a message carrying Murli content has been added to the conversation
+    final_marker_seen: Optional[bool]
+    # Tool call IDs whose tavily-extract output has already been processed into documents
+    processed_tool_call_ids: Optional[List[str]]
@@ -0,0 +1,61 @@
+import unittest
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from web_content_extraction_agent.agent import _trim_prompt_messages
+
+
+class TestTrimPromptMessages(unittest.TestCase):
+
+    def setUp(self):
+        self.task_prompt = HumanMessage(content="Extract the hindi murli for 2025-09-08.")
+        self.messages = [
+            self.task_prompt,
+            AIMessage(content="", tool_calls=[{"name": "tavily-map", "args": {"url": "u"}, "id": "1"}]),
+            ToolMessage(content="site map " * 200, name="tavily-map", tool_call_id="1"),
+            HumanMessage(content="Find the murli URL in the site map."),
+            AIMessage(content="", tool_calls=[{"name": "tavily-extract", "args": {"urls": ["u"]}, "id": "2"}]),
+            ToolMessage(content="page " * 200, name="tavily-extract", tool_call_id="2"),
+            HumanMessage(content="Present the extracted murli content."),
+        ]
+
+    def test_task_prompt_is_kept_when_history_is_trimmed(self):
+        """Even with a small budget the task prompt leads the window and only recent messages follow it."""
+        trimmed = _trim_prompt_messages(self.messages, max_tokens=100)
+        self.assertIs(trimmed[0], self.task_prompt)
+        self.assertLess(len(trimmed), len(self.messages))
+        self.assertIs(trimmed[-1], self.messages[-1])
+
+    def test_window_starts_on_a_human_message(self):
+        """A tool result is never sent without the AI message whose call produced it."""
+        trimmed = _trim_prompt_messages(self.messages, max_tokens=400)
+        self.assertIsInstance(trimmed[1], HumanMessage)
+        self.assertNotIsInstance(trimmed[1], ToolMessage)
+
+    def test_newest_message_is_sent_even_if_over_budget(self):
+        trimmed = _trim_prompt_messages(self.messages, max_tokens=1)
+        self.assertEqual(trimmed, [self.task_prompt, self.messages[-1]])
+
+    def test_newest_tool_result_is_sent_with_its_call_even_if_over_budget(self):
+        """A tool result without a guiding prompt is sent together with the AIMessage that requested it."""
+        call = AIMessage(content="", tool_calls=[
+            {"name": "tavily-search", "args": {"query": "q"}, "id": "3"},
+            {"name": "tavily-search", "args": {"query": "r"}, "id": "4"},
+        ])
+        results = [
+            ToolMessage(content="result " * 200, name="tavily-search", tool_call_id="3"),
+            ToolMessage(content="result " * 200, name="tavily-search", tool_call_id="4"),
+        ]
+        messages = [*self.messages, call, *results]
+        trimmed = _trim_prompt_messages(messages, max_tokens=1)
+        self.assertEqual(trimmed, [self.task_prompt, call, *results])
+
+    def test_full_history_is_sent_within_budget(self):
+        self.assertEqual(_trim_prompt_messages(self.messages, max_tokens=32000), self.messages)
+
+    def test_task_prompt_alone(self):
+        self.assertEqual(_trim_prompt_messages([self.task_prompt], max_tokens=1), [self.task_prompt])
+
+
+if __name__ == '__main__':
+    unittest.main()
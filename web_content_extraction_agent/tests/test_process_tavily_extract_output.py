@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from web_content_extraction_agent.process_tavily_extract_output import (
+    _deduplicate_text,
+    _extract_tavily_extract_content,
+    _extract_url,
+)
+
+_KEYWORD = "प्रात:मुरली"
+
+
+class TestExtractUrl(unittest.TestCase):
+
+    def test_url_line_is_extracted(self):
+        self.assertEqual(_extract_url("Title: x\nURL: https://www.babamurli.com/h.htm  \nRaw Content: y"), "https://www.babamurli.com/h.htm")
+
+    def test_url_on_the_last_line(self):
+        self.assertEqual(_extract_url("URL: https://www.babamurli.com/"), "https://www.babamurli.com/")
+
+    def test_missing_url(self):
+        self.assertEqual(_extract_url("Raw Content: y"), "")
+
+
+class TestDeduplicateText(unittest.TestCase):
+
+    def test_content_between_the_first_two_keywords_is_kept(self):
+        """The unique content runs from the start of the first keyword's line to the second keyword."""
+        text = f"menu\n08-09-2025 {_KEYWORD} ओम शान्ति\nबापदादा\n{_KEYWORD} duplicate copy {_KEYWORD} again"
+        self.assertEqual(_deduplicate_text(text), f"08-09-2025 {_KEYWORD} ओम शान्ति\nबापदादा")
+
+    def test_keyword_on_the_first_line(self):
+        text = f"{_KEYWORD} ओम शान्ति {_KEYWORD} duplicate"
+        self.assertEqual(_deduplicate_text(text), f"{_KEYWORD} ओम शान्ति")
+
+    def test_text_without_a_repeated_keyword_is_returned_whole(self):
+        self.assertEqual(_deduplicate_text(f"menu\n{_KEYWORD} ओम शान्ति"), f"menu\n{_KEYWORD} ओम शान्ति")
+        self.assertEqual(_deduplicate_text("no keyword"), "no keyword")
+
+    def test_keywords_outside_the_bounds_are_ignored(self):
+        """Only text[start:end] is searched, and the slice never reaches back before start."""
+        prefix = f"{_KEYWORD} header\n"
+        body = f"08-09-2025 {_KEYWORD} ओम शान्ति {_KEYWORD} duplicate"
+        suffix = f"\nfooter {_KEYWORD}"
+        text = prefix + body + suffix
+        start, end = len(prefix), len(prefix) + len(body)
+        self.assertEqual(_deduplicate_text(text, start, end), f"08-09-2025 {_KEYWORD} ओम शान्ति")
+
+    def test_second_keyword_past_end_is_not_used(self):
+        text = f"{_KEYWORD} ओम शान्ति {_KEYWORD}"
+        self.assertEqual(_deduplicate_text(text, 0, len(text) - 1), text[:-1])
+
+
+class TestExtractTavilyExtractContent(unittest.TestCase):
+
+    def _extract(self, tool_content: str):
+        return asyncio.run(_extract_tavily_extract_content(tool_content))
+
+    def test_raw_content_is_stripped_and_deduplicated(self):
+        tool_content = (
+            "Detailed Results:\n\nTitle: x\nURL: https://www.babamurli.com/h.htm\n"
+            f"Raw Content: \n\n  08-09-2025 {_KEYWORD} ओम शान्ति मीठे बच्चे बापदादा कहते हैं {_KEYWORD} duplicate  \n\n"
+        )
+        docs_content, docs_metadata = self._extract(tool_content)
+        self.assertEqual(docs_content, [f"08-09-2025 {_KEYWORD} ओम शान्ति मीठे बच्चे बापदादा कहते हैं"])
+        self.assertEqual(docs_metadata[0]["source"], "https://www.babamurli.com/h.htm")
+        self.assertEqual(docs_metadata[0]["date"], "2025-09-08")
+
+    def test_blank_or_missing_raw_content(self):
+        self.assertEqual(self._extract("URL: u\nRaw Content: \n \t\n"), ([], []))
+        self.assertEqual(self._extract("URL: u"), ([], []))
+
+    def test_raw_content_is_capped(self):
+        with patch("web_content_extraction_agent.process_tavily_extract_output._MAX_RAW_CONTENT_CHARS", 10):
+            docs_content, _ = self._extract("Raw Content: 0123456789 past the cap")
+        self.assertEqual(docs_content, ["0123456789"])
+
+
+if __name__ == '__main__':
+    unittest.main()